@@ -0,0 +1,8 @@
+"""Python engines for the TD Sequential study of tdsequential.py."""
+
+from .batch import ALERTS, SERIES, compute
+from .params import PRICE_SOURCES, Params, price_source
+from .stream import TDStream
+from .table import TDTable
+
+__all__ = ['ALERTS', 'SERIES', 'compute', 'PRICE_SOURCES', 'Params', 'price_source', 'TDStream', 'TDTable']
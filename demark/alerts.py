@@ -0,0 +1,246 @@
+"""Asyncio delivery of the alertcondition() signals to pluggable sinks.
+
+The Dispatcher gives every sink its own bounded queue and delivery task:
+  - publish() fills the queues of all sinks concurrently and returns once every
+    alert is queued: a full queue holds back the producer (backpressure), but
+    not the delivery to the other sinks
+  - a sink task takes the first waiting alert, then lingers briefly to coalesce
+    everything else that fired on the same close into one batch
+  - a failing sink logs and drops its batch without stalling the other sinks
+
+Alerts come from a batch event log (from_events) or from a live engine:
+LiveAlerts feeds closed bars to a TDStream or TDTable and publishes the alerts
+each bar raises.
+
+Sinks implement `async send(batch)` for a list of Alert. WebhookSink (HTTP POST
+of a JSON array), SocketSink (JSON lines over TCP or a Unix socket) and FileSink
+(JSON lines appended to a file) need nothing beyond the standard library.
+"""
+
+import asyncio
+import json
+import logging
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from . import pine
+from .batch import ALERTS
+from .events import EVENTS
+
+log = logging.getLogger(__name__)
+
+Alert = namedtuple('Alert', 'symbol bar kind title price count')
+
+
+def from_events(symbol, events):
+    """Alerts for the alertcondition() records of an event log (events.EVENT_DTYPE)."""
+    return [Alert(symbol, int(e['bar']), int(e['kind']), EVENTS[e['kind']][1], float(e['price']), int(e['count']))
+            for e in events if e['kind'] < len(ALERTS)]
+
+
+def from_update(symbols, bar, out):
+    """Alerts for bar `bar` of one TDStream.update() result (`symbols` a single
+    name) or TDTable.update() result (`symbols` a sequence of names)."""
+    single = isinstance(symbols, str)
+    alerts = []
+    for k, (name, _) in enumerate(ALERTS):
+        price, count = np.atleast_1d(out[name]), np.atleast_1d(pine.nz(out[EVENTS[k][2]]))
+        for i in np.flatnonzero(pine.truthy(price)):
+            alerts.append(Alert(symbols if single else symbols[i], bar, k, EVENTS[k][1],
+                                float(price[i]), int(count[i])))
+    return alerts
+
+
+class LiveAlerts:
+    """Publish the alerts of a live engine: each closed bar passed to update()
+    goes to `engine` (a TDStream for the single symbol `symbols`, or a TDTable
+    over the sequence `symbols`), and the alerts it raises to `dispatcher`."""
+
+    def __init__(self, dispatcher, engine, symbols):
+        self.dispatcher = dispatcher
+        self.engine = engine
+        self.symbols = symbols
+
+    async def update(self, open, high, low, close):
+        """The engine's update() result, once its alerts are queued."""
+        out = self.engine.update(open, high, low, close)
+        alerts = from_update(self.symbols, self.engine.bar, out)
+        if alerts:
+            await self.dispatcher.publish(alerts)
+        return out
+
+
+def to_json(batch):
+    return json.dumps([alert._asdict() for alert in batch]).encode()
+
+
+class Dispatcher:
+    """Fan alerts out to sinks with per-sink batching and bounded queues.
+
+    Use as `async with Dispatcher(sinks) as dispatcher: await dispatcher.publish(...)`.
+    Leaving the block delivers everything already queued.
+    """
+
+    def __init__(self, sinks, queue_size=10000, batch_size=500, linger=0.005):
+        self.sinks = list(sinks)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.linger = linger
+        self._queues = None
+        self._tasks = []
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start(self):
+        self._queues = [asyncio.Queue(self.queue_size) for _ in self.sinks]
+        self._tasks = [asyncio.create_task(self._deliver(sink, queue))
+                       for sink, queue in zip(self.sinks, self._queues)]
+
+    async def publish(self, alerts):
+        """Queue alerts for every sink, waiting while a sink's queue is full."""
+        if self._queues is None:
+            raise RuntimeError('Dispatcher.publish() outside start() .. close()')
+        await asyncio.gather(*(_put(queue, alerts) for queue in self._queues))
+
+    async def close(self):
+        for queue in self._queues or ():
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queues, self._tasks = None, []
+        for sink in self.sinks:
+            await sink.close()
+
+    async def _deliver(self, sink, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(queue.get_nowait())
+            try:
+                await sink.send(batch)
+            except Exception:
+                log.exception('%s dropped %d alerts', sink, len(batch))
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+
+async def _put(queue, alerts):
+    for alert in alerts:
+        await queue.put(alert)
+
+
+class Sink:
+    async def send(self, batch):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class WebhookSink(Sink):
+    """POST each batch as a JSON array to an http:// or https:// URL."""
+
+    def __init__(self, url, timeout=10.0):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('unsupported webhook URL %r' % (url,))
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = parts.scheme == 'https'
+        self.path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        self.timeout = timeout
+
+    def __repr__(self):
+        return 'WebhookSink(%r)' % (self.url,)
+
+    async def send(self, batch):
+        await asyncio.wait_for(self._post(to_json(batch)), self.timeout)
+
+    async def _post(self, body):
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        try:
+            writer.write(('POST %s HTTP/1.1\r\n'
+                          'Host: %s\r\n'
+                          'Content-Type: application/json\r\n'
+                          'Content-Length: %d\r\n'
+                          'Connection: close\r\n\r\n' % (self.path, self.host, len(body))).encode() + body)
+            await writer.drain()
+            status = (await reader.readline()).split()
+            if len(status) < 2 or not status[1].isdigit() or not 200 <= int(status[1]) < 300:
+                raise OSError('webhook %s answered %r' % (self.url, b' '.join(status)))
+            await reader.read()
+        finally:
+            writer.close()
+
+
+class SocketSink(Sink):
+    """JSON lines over a persistent TCP (host, port) or Unix socket (path) connection."""
+
+    def __init__(self, host=None, port=None, path=None, timeout=10.0):
+        self.host, self.port, self.path = host, port, path
+        self.timeout = timeout
+        self._writer = None
+
+    def __repr__(self):
+        return 'SocketSink(%r)' % (self.path or (self.host, self.port),)
+
+    async def send(self, batch):
+        # A stalled peer must not hold the sink's task (and Dispatcher.close()) forever
+        try:
+            await asyncio.wait_for(self._send(batch), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            await self.close()
+            raise
+
+    async def _send(self, batch):
+        if self._writer is None or self._writer.is_closing():
+            if self.path:
+                _, self._writer = await asyncio.open_unix_connection(self.path)
+            else:
+                _, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(b''.join(json.dumps(alert._asdict()).encode() + b'\n' for alert in batch))
+        await self._writer.drain()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class FileSink(Sink):
+    """Append JSON lines to a file, written off the event loop."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __repr__(self):
+        return 'FileSink(%r)' % (self.path,)
+
+    async def send(self, batch):
+        lines = ''.join(json.dumps(alert._asdict()) + '\n' for alert in batch)
+        await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+
+    def _append(self, lines):
+        with open(self.path, 'a') as f:
+            f.write(lines)
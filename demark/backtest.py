@@ -0,0 +1,170 @@
+"""Vectorized event studies of the study's signals.
+
+Events come from the event log (events.from_series) of every symbol of a
+columnar universe (see scan) and every Params combination (evaluated with
+sweep, sharing intermediates). They are then measured all at once with no
+per-event loop. For each event, entered at the close of its bar on the side
+the signal points to (sell signals short, buy signals long):
+  - returns: signed forward return at each horizon
+  - mfe, mae: maximum favourable / adverse excursion up to each horizon, in
+    units of the distance from the entry to riskLevel on the event bar
+  - stopped: whether riskLevel was reached up to each horizon (mae >= 1)
+Horizons running past the end of a symbol's history are na.
+
+Only the riskLevel set by the event itself measures it: on other bars the
+series carries the level of an older event, possibly on the wrong side of the
+entry. risk, and so mfe and mae, are na (stopped false) for the events that
+set no level (perfections, deferred countdowns) and for an event whose bar's
+level was set by a higher-priority event (see batch.risk_level).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from . import pine
+from .events import EVENT_DTYPE, EVENTS, SOURCES, from_series
+from .params import Params
+from .sweep import sweep
+
+# Trade direction of each event kind: sell signals -1, buy signals 1. The
+# recycles and deferred countdowns point the same way as their count.
+SIDES = {
+    'setupSell': -1, 'setupSellPerf': -1, 'setupBuy': 1, 'setupBuyPerf': 1,
+    'cntdwnSell': -1, 'cntdwnBuy': 1,
+    'cntdwnCountUpRecycle': -1, 'cntdwnCountDownRecycle': 1,
+    'cntdwnSellDefer': -1, 'cntdwnBuyDefer': 1,
+}
+
+# The events setting riskLevel, in order of priority when several fire on a bar
+RISK_EVENTS = (
+    ('setupSell', 'cntdwnCountUpRecycle'),
+    ('setupBuy', 'cntdwnCountDownRecycle'),
+    ('cntdwnSell',),
+    ('cntdwnBuy',),
+)
+
+STUDY_DTYPE = np.dtype(EVENT_DTYPE.descr + [
+    ('combo', '<i4'), ('symbol', '<i4'), ('side', 'i1'), ('entry', '<f8'), ('risk', '<f8'),
+])
+
+EventStudy = namedtuple('EventStudy', 'events horizons returns mfe mae stopped combinations')
+
+
+def event_study(bars, offsets, combinations=(Params(),), horizons=(1, 5, 10, 20), kinds=None):
+    """Measure every event of every symbol and Params combination.
+
+    bars: mapping of 'open', 'high', 'low', 'close' to columnar float64 arrays
+    offsets: symbol boundaries, length symbols + 1
+    kinds: event series names to keep, default all of events.EVENTS
+    Returns an EventStudy. events is a STUDY_DTYPE record per event, with its
+    global bar index; the other arrays have one row per event and one column
+    per horizon.
+    """
+    names = [name for name, _, _ in EVENTS]
+    unknown = [name for name in kinds or () if name not in names]
+    if unknown:
+        raise ValueError('unknown event kinds %s, expected some of %s'
+                         % (', '.join(map(str, unknown)), ', '.join(names)))
+    offsets = np.asarray(offsets, dtype=np.int64)
+    close, high, low = (np.asarray(bars[field], dtype=np.float64) for field in ('close', 'high', 'low'))
+    combinations = list(dict.fromkeys(combinations))
+    combo = {params: i for i, params in enumerate(combinations)}
+    keep = np.array([kinds is None or name in kinds for name in names])
+    sides = np.array([SIDES[name] for name, _, _ in EVENTS], dtype=np.int8)
+    outputs = SOURCES + ('riskLevel',)
+
+    logs = []
+    for symbol in range(len(offsets) - 1):
+        a, b = offsets[symbol], offsets[symbol + 1]
+        if a == b:
+            continue
+        ohlc = (bars['open'][a:b], high[a:b], low[a:b], close[a:b])
+        for params, s in sweep(*ohlc, combinations, outputs):
+            log = from_series(s, start=a)
+            log = log[keep[log['kind']]]
+            study = np.empty(len(log), dtype=STUDY_DTYPE)
+            for name in log.dtype.names:
+                study[name] = log[name]
+            study['combo'] = combo[params]
+            study['symbol'] = symbol
+            study['risk'] = _risk(s, log['bar'] - a, log['kind'])
+            logs.append(study)
+    study = np.concatenate(logs) if logs else np.empty(0, dtype=STUDY_DTYPE)
+    study['side'] = sides[study['kind']]
+    study['entry'] = close[study['bar']]
+    returns, mfe, mae = measure(close, high, low, study['bar'], offsets[study['symbol'] + 1],
+                                study['side'], study['risk'], horizons)
+    return EventStudy(study, tuple(horizons), returns, mfe, mae, mae >= 1, combinations)
+
+
+def _risk(s, bar, kind):
+    # riskLevel on each event's bar where the event set it, na elsewhere
+    setter = np.full(len(bar), -1)
+    for i, group in reversed(list(enumerate(RISK_EVENTS))):
+        fired = np.zeros(len(bar), dtype=bool)
+        for name in group:
+            fired |= pine.truthy(np.asarray(s[name], dtype=np.float64)[bar])
+        setter[fired] = i
+    own = np.array([next((i for i, group in enumerate(RISK_EVENTS) if name in group), -2) for name, _, _ in EVENTS])
+    return np.where(setter == own[kind], np.asarray(s['riskLevel'], dtype=np.float64)[bar], np.nan)
+
+
+def measure(close, high, low, bar, end, side, risk, horizons):
+    """(returns, mfe, mae), each (events, horizons), for entries at close[bar]
+    whose history ends before bar `end`; see the module docstring."""
+    horizons = np.asarray(horizons, dtype=np.int64)
+    if (horizons < 1).any():
+        raise ValueError('horizons must be at least one bar')
+    longest = int(horizons.max()) if len(horizons) else 0
+    entry = close[bar]
+
+    # Every bar after the entry up to the longest horizon, one row per event
+    ahead = bar[:, None] + np.arange(1, longest + 1)
+    inside = ahead < end[:, None]
+    ahead = np.where(inside, ahead, bar[:, None])
+    highs = np.maximum.accumulate(np.where(inside, high[ahead], -np.inf), axis=1)
+    lows = np.minimum.accumulate(np.where(inside, low[ahead], np.inf), axis=1)
+
+    column = horizons - 1
+    valid = inside[:, column]
+    up = side[:, None] > 0
+    exit = close[ahead[:, column]]
+    returns = np.where(valid, side[:, None] * (exit / entry[:, None] - 1), np.nan)
+    distance = np.abs(entry - risk)
+    distance = np.where(distance > 0, distance, np.nan)[:, None]
+    favourable = np.where(up, highs[:, column] - entry[:, None], entry[:, None] - lows[:, column])
+    adverse = np.where(up, entry[:, None] - lows[:, column], highs[:, column] - entry[:, None])
+    mfe = np.where(valid, favourable / distance, np.nan)
+    mae = np.where(valid, adverse / distance, np.nan)
+    return returns, mfe, mae
+
+
+def summary(study, by=('combo', 'kind')):
+    """Per group of the `by` event fields: count, and per horizon the mean
+    return, hit rate (share of positive returns), mean mfe/mae and stop rate.
+    Returns (keys, stats): keys is a record array of the groups, stats a dict of
+    (groups, horizons) arrays plus 'count' (groups,)."""
+    keys, group = np.unique(study.events[list(by)], return_inverse=True)
+    groups = len(keys)
+
+    def mean(values):
+        ok = ~np.isnan(values)
+        total = np.zeros((groups, values.shape[1]))
+        count = np.zeros((groups, values.shape[1]))
+        np.add.at(total, group, np.where(ok, values, 0.0))
+        np.add.at(count, group, ok)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return total / count
+
+    returns = study.returns
+    hits = np.where(np.isnan(returns), np.nan, returns > 0)
+    stopped = np.where(np.isnan(study.mae), np.nan, study.stopped)
+    return keys, {
+        'count': np.bincount(group, minlength=groups),
+        'return': mean(returns),
+        'hitRate': mean(hits),
+        'mfe': mean(study.mfe),
+        'mae': mean(study.mae),
+        'stopRate': mean(stopped),
+    }
@@ -0,0 +1,405 @@
+"""Vectorized batch engine: the whole study over full OHLC arrays.
+
+Every series of tdsequential.py is reproduced under its Pine name. The [1]-lagged
+recurrences of the script are rewritten as closed forms over "last index where"
+arrays (see pine.last_index), so each section is a handful of NumPy passes and no
+per-bar interpreter loop is involved.
+
+Series dtypes:
+  - impulse booleans without na (setupPriceUp, ...) are bool
+  - setupCountUp/Down are int64
+  - everything else is float64 with na as NaN
+"""
+
+import time
+from collections import namedtuple
+from dataclasses import fields
+
+import numpy as np
+
+from . import pine
+from .params import Params, price_source
+
+# Values of the perfection and qualification masks, as in the script
+setupIsPerfected = 2
+setupIsDeferred = 1
+cntdwnIsQualified = 2
+cntdwnIsDeferred = 1
+
+SERIES = (
+    'PriceSource',
+    # TD Price Flips
+    'setupPriceUp', 'setupPriceDown', 'setupPriceEqual',
+    # TD Setups
+    'setupCountUp', 'setupCountDown', 'setupSell', 'setupBuy', 'setupSellCount', 'setupBuyCount',
+    'setupSellPerfPrice', 'setupSellPerfMask', 'setupSellPerf',
+    'setupBuyPerfPrice', 'setupBuyPerfMask', 'setupBuyPerf',
+    # TDST
+    'setupTrendSupport', 'setupTrendResist',
+    # TD Countdown
+    'cntdwnPriceUp', 'cntdwnPriceDown', 'cntdwnCountUpRecycle', 'cntdwnCountDownRecycle',
+    'cntdwnCountUp', 'cntdwnCountUpImp', 'cntdwnCountDown', 'cntdwnCountDownImp',
+    'cntdwnSellQualPrice', 'cntdwnSellQualMask', 'cntdwnSellQualMaskImp',
+    'cntdwnBuyQualPrice', 'cntdwnBuyQualMask', 'cntdwnBuyQualMaskImp',
+    'cntdwnSell', 'cntdwnSellDefer', 'cntdwnBuy', 'cntdwnBuyDefer',
+    # TD Risk Level
+    'riskLevel',
+)
+
+# alertcondition() signals of the script: (series, title)
+ALERTS = (
+    ('setupSell', 'Sell Setup'),
+    ('setupSellPerf', 'Sell Setup Perfected'),
+    ('setupBuy', 'Buy Setup'),
+    ('setupBuyPerf', 'Buy Setup Perfected'),
+    ('cntdwnSell', 'Sell Countdown'),
+    ('cntdwnBuy', 'Buy Countdown'),
+    ('cntdwnCountUpRecycle', 'Countdown Recycle Up'),
+    ('cntdwnCountDownRecycle', 'Countdown Recycle Down'),
+)
+
+
+class Namespace(dict):
+    """The flat series namespace of one run, with its shared valuewhen() index."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.when = pine.WhenIndex(self)
+
+
+def compute(open, high, low, close, params=Params(), outputs=SERIES, metrics=None):
+    """Run the study over whole OHLC arrays. Returns {series name: ndarray}.
+
+    Only the sections `outputs` depend on are evaluated, e.g. asking for
+    ('setupSell', 'setupBuy') never touches the countdown or riskLevel.
+    `metrics` is an optional metrics.Metrics recording the section timings.
+    """
+    s = namespace(open, high, low, close)
+    for section in pipeline(outputs):
+        if metrics is None:
+            section.run(s, params)
+        else:
+            start = time.perf_counter()
+            section.run(s, params)
+            metrics.section(section.run.__name__, time.perf_counter() - start)
+    if metrics is not None:
+        metrics.batch(s, len(s['close']))
+    return {name: s[name] for name in outputs}
+
+
+# The input columns of a run, in argument order
+FIELDS = ('open', 'high', 'low', 'close')
+
+
+def namespace(open, high, low, close):
+    """A fresh Namespace holding the OHLC inputs."""
+    return Namespace(
+        open=np.asarray(open, dtype=np.float64),
+        high=np.asarray(high, dtype=np.float64),
+        low=np.asarray(low, dtype=np.float64),
+        close=np.asarray(close, dtype=np.float64),
+    )
+
+
+def source(s, p):
+    s['PriceSource'] = price_source(s['open'], s['high'], s['low'], s['close'], p.PriceSource)
+
+
+#---- TD Price Flips ---------------------------
+def price_flips(s, p):
+    src = s['PriceSource']
+    prior = pine.shift(src, p.SetupLookback)
+    s['setupPriceUp'] = src > prior
+    s['setupPriceDown'] = src < prior
+    s['setupPriceEqual'] = src == prior
+
+
+#---- TD Setups ---------------------------
+def setup_counts(s, p):
+    up, down, equal = s['setupPriceUp'], s['setupPriceDown'], s['setupPriceEqual']
+    if p.SetupEqualEnable:
+        # (setupPriceUp or (setupCountUp[1] and setupPriceEqual)) keeps counting through
+        # equal bars once an up count is running: the run is alive if the last up bar
+        # is more recent than the last bar that was neither up nor equal.
+        up = pine.last_index(up) > pine.last_index(~(up | equal))
+        down = pine.last_index(down) > pine.last_index(~(down | equal))
+    s['setupCountUp'] = pine.run_length(up)
+    s['setupCountDown'] = pine.run_length(down)
+
+
+def setups(s, p):
+    src = s['PriceSource']
+    s['setupSell'] = np.where(s['setupCountUp'] == p.SetupBars, src, pine.na)
+    s['setupBuy'] = np.where(s['setupCountDown'] == p.SetupBars, src, pine.na)
+    s['setupSellCount'] = pine.barssince(s['setupSell'])
+    s['setupBuyCount'] = pine.barssince(s['setupBuy'])
+
+
+def setup_perfection(s, p):
+    src, high, low, when = s['PriceSource'], s['high'], s['low'], s.when
+    first = p.SetupBars - p.SetupPerfLookback
+
+    # The setup event index anchors both the perfection price and the mask
+    event = s['setupCountUp'] == p.SetupBars
+    eventIndex = when.last('setupCountUp', '==', p.SetupBars)
+    a = when.valuewhen('setupCountUp', '==', first, high)
+    b = when.valuewhen('setupCountUp', '==', first + 1, high)
+    s['setupSellPerfPrice'] = price = pine.stair(np.where(a >= b, a, b), event, eventIndex)
+    hit = np.where(event,
+                   (when.valuewhen('setupCountUp', '==', p.SetupBars - 1, high) >= price) | (high >= price),
+                   high >= price)
+    s['setupSellPerfMask'] = mask = _latch_mask(event, ~np.isnan(s['setupBuy']), hit,
+                                                setupIsPerfected, setupIsDeferred, eventIndex)
+    s['setupSellPerf'] = np.where(mask == setupIsPerfected, src, pine.na)
+
+    event = s['setupCountDown'] == p.SetupBars
+    eventIndex = when.last('setupCountDown', '==', p.SetupBars)
+    a = when.valuewhen('setupCountDown', '==', first, low)
+    b = when.valuewhen('setupCountDown', '==', first + 1, low)
+    s['setupBuyPerfPrice'] = price = pine.stair(np.where(a <= b, a, b), event, eventIndex)
+    hit = np.where(event,
+                   (when.valuewhen('setupCountDown', '==', p.SetupBars - 1, low) <= price) | (low <= price),
+                   low <= price)
+    s['setupBuyPerfMask'] = mask = _latch_mask(event, ~np.isnan(s['setupSell']), hit,
+                                               setupIsPerfected, setupIsDeferred, eventIndex)
+    s['setupBuyPerf'] = np.where(mask == setupIsPerfected, src, pine.na)
+
+
+#---- TD Setup Trend (TDST) ---------------------------
+def setup_trend(s, p):
+    s['setupTrendSupport'] = _trend_level(s['setupSell'], s['setupSellCount'], s['low'], np.minimum, p)
+    s['setupTrendResist'] = _trend_level(s['setupBuy'], s['setupBuyCount'], s['high'], np.maximum, p)
+
+
+def _trend_level(setup, setupCount, x, extreme, p):
+    event = pine.truthy(setup)
+    bars = np.flatnonzero(event)
+    level = np.full(len(x), pine.na)
+    if p.SetupTrendExtend and p.SetupTrendExact:
+        # Exact extended TDST: the extreme from the previous same-direction setup
+        # bar (or the first bar) through this one. Consecutive windows only share
+        # their end points, so one segmented reduction answers every query.
+        if len(bars):
+            since = extreme.reduceat(x, np.concatenate(([0], bars)))[:-1]
+            level[bars] = extreme(since, x[bars])
+        return pine.stair(level, event)
+
+    extreme_at = pine.lowest_at if extreme is np.minimum else pine.highest_at
+    if p.SetupTrendExtend:
+        # The script's ladder: the smallest k*SetupBars (k <= 10) covering setupCount[1]
+        prevCount = pine.shift(setupCount, 1)[bars]
+        steps = np.ceil(prevCount / p.SetupBars)
+        steps = np.where(np.isnan(prevCount) | (steps > 10), 10, np.maximum(steps, 1)).astype(np.int64)
+    else:
+        steps = np.ones(len(bars), dtype=np.int64)
+    for k in np.unique(steps):
+        sel = bars[steps == k]
+        level[sel] = extreme_at(x, k * p.SetupBars, sel)
+    return pine.stair(level, event)
+
+
+#---- TD Countdown ---------------------------
+def countdown_price(s, p):
+    src, high, low = s['PriceSource'], s['high'], s['low']
+    if p.CntdwnAggressive:
+        up, upPrior = high, pine.shift(high, p.CntdwnLookback)
+        down, downPrior = low, pine.shift(low, p.CntdwnLookback)
+    else:
+        up, upPrior = src, pine.shift(high, p.CntdwnLookback)
+        down, downPrior = src, pine.shift(low, p.CntdwnLookback)
+    s['cntdwnPriceUp'] = _na_bool(up >= upPrior, up, upPrior)
+    s['cntdwnPriceDown'] = _na_bool(down <= downPrior, down, downPrior)
+
+
+def recycle(s, p):
+    src = s['PriceSource']
+    s['cntdwnCountUpRecycle'] = np.where(s['setupCountUp'] == 2 * p.SetupBars, src, pine.na)
+    s['cntdwnCountDownRecycle'] = np.where(s['setupCountDown'] == 2 * p.SetupBars, src, pine.na)
+
+
+def countdown(s, p):
+    src = s['PriceSource']
+    s['cntdwnCountUp'] = _countdown_count(
+        s['cntdwnPriceUp'], s['setupSell'],
+        ~np.isnan(s['setupBuy']) | (src < s['setupTrendSupport']) | ~np.isnan(s['cntdwnCountUpRecycle']))
+    s['cntdwnCountUpImp'] = np.where(pine.truthy(s['cntdwnPriceUp']), s['cntdwnCountUp'], pine.na)
+    s['cntdwnCountDown'] = _countdown_count(
+        s['cntdwnPriceDown'], s['setupBuy'],
+        ~np.isnan(s['setupSell']) | (src > s['setupTrendResist']) | ~np.isnan(s['cntdwnCountDownRecycle']))
+    s['cntdwnCountDownImp'] = np.where(pine.truthy(s['cntdwnPriceDown']), s['cntdwnCountDown'], pine.na)
+
+
+def _na_bool(cond, a, b):
+    # A comparison with an na operand is itself na
+    return np.where(np.isnan(a) | np.isnan(b), pine.na, cond.astype(np.float64))
+
+
+def _countdown_count(priceMove, setup, cancel):
+    # Bars where the price move is na carry the previous count, so they neither
+    # anchor nor add to the count. Otherwise the count restarts on a setup bar,
+    # goes na on a cancellation bar, and adds up price moves in between.
+    valid = ~np.isnan(priceMove)
+    cancel = valid & cancel
+    start = valid & ~cancel & ~np.isnan(setup)
+    anchor = pine.last_index(cancel | start)
+    moves = np.cumsum(pine.nz(priceMove))
+    base = np.where(anchor > 0, moves[np.maximum(anchor - 1, 0)], 0.0)
+    live = (anchor >= 0) & start[np.maximum(anchor, 0)]
+    return np.where(live, moves - base, pine.na)
+
+
+def countdown_qualification(s, p):
+    src, high, low, when = s['PriceSource'], s['high'], s['low'], s.when
+    countUp, countUpImp = s['cntdwnCountUp'], s['cntdwnCountUpImp']
+    countDown, countDownImp = s['cntdwnCountDown'], s['cntdwnCountDownImp']
+    if p.CntdwnQualBar < p.CntdwnBars:
+        s['cntdwnSellQualPrice'] = price = pine.stair(
+            src, countUpImp == p.CntdwnQualBar, when.last('cntdwnCountUpImp', '==', p.CntdwnQualBar))
+        event = countUpImp == p.CntdwnBars
+        hit = (event | (countUpImp > p.CntdwnBars)) & (high >= price)
+        s['cntdwnSellQualMask'] = _latch_mask(event, np.isnan(countUp), hit, cntdwnIsQualified, cntdwnIsDeferred,
+                                              when.last('cntdwnCountUpImp', '==', p.CntdwnBars))
+
+        s['cntdwnBuyQualPrice'] = price = pine.stair(
+            src, countDownImp == p.CntdwnQualBar, when.last('cntdwnCountDownImp', '==', p.CntdwnQualBar))
+        event = countDownImp == p.CntdwnBars
+        hit = (event | (countDownImp > p.CntdwnBars)) & (low <= price)
+        s['cntdwnBuyQualMask'] = _latch_mask(event, np.isnan(countDown), hit, cntdwnIsQualified, cntdwnIsDeferred,
+                                             when.last('cntdwnCountDownImp', '==', p.CntdwnBars))
+    else:
+        s['cntdwnSellQualPrice'] = np.full(len(src), pine.na)
+        s['cntdwnBuyQualPrice'] = np.full(len(src), pine.na)
+        s['cntdwnSellQualMask'] = np.where(countUp == p.CntdwnBars, cntdwnIsQualified, pine.na)
+        s['cntdwnBuyQualMask'] = np.where(countDown == p.CntdwnBars, cntdwnIsQualified, pine.na)
+
+    s['cntdwnSellQualMaskImp'] = sellImp = np.where(pine.truthy(countUpImp), s['cntdwnSellQualMask'], pine.na)
+    s['cntdwnBuyQualMaskImp'] = buyImp = np.where(pine.truthy(countDownImp), s['cntdwnBuyQualMask'], pine.na)
+
+    s['cntdwnSell'] = np.where(sellImp == cntdwnIsQualified, src, pine.na)
+    s['cntdwnSellDefer'] = np.where(sellImp == cntdwnIsDeferred, src, pine.na)
+    s['cntdwnBuy'] = np.where(buyImp == cntdwnIsQualified, src, pine.na)
+    s['cntdwnBuyDefer'] = np.where(buyImp == cntdwnIsDeferred, src, pine.na)
+
+
+#---- TD Risk Level ---------------------------
+def risk_level(s, p):
+    high, low = s['high'], s['low']
+    s['tr'] = pine.true_range(high, low, s['close'])
+    sellEvent = pine.truthy(s['setupSell']) | pine.truthy(s['cntdwnCountUpRecycle'])
+    buyEvent = ~sellEvent & (pine.truthy(s['setupBuy']) | pine.truthy(s['cntdwnCountDownRecycle']))
+    cntdwnSellEvent = ~sellEvent & ~buyEvent & pine.truthy(s['cntdwnSell'])
+    cntdwnBuyEvent = ~sellEvent & ~buyEvent & ~cntdwnSellEvent & pine.truthy(s['cntdwnBuy'])
+
+    level = np.full(len(high), pine.na)
+    for event, length, sign in ((sellEvent, p.SetupBars, 1),
+                                (buyEvent, p.SetupBars, -1),
+                                (cntdwnSellEvent, p.CntdwnBars, 1),
+                                (cntdwnBuyEvent, p.CntdwnBars, -1)):
+        if event.any():
+            # The extreme and its bar are kept under their Pine expression so both
+            # windows of the same length share them
+            x, name = ('high', 'highest(%d)' % length) if sign > 0 else ('low', 'lowest(%d)' % length)
+            if name not in s:
+                s[name], s[name + '.index'] = pine.rolling_extreme(s[x], length, maximum=sign > 0)
+            extremeTr = pine.gather(s['tr'], s[name + '.index'])
+            level[event] = s[name][event] + sign * extremeTr[event]
+
+    # nz(riskLevel[1], low): a bar following na (the first bar, or an na event
+    # value) takes its own low, which is then carried like any other level.
+    event = sellEvent | buyEvent | cntdwnSellEvent | cntdwnBuyEvent
+    seed = event | ~event & np.isnan(pine.shift(np.where(event, level, 0.0), 1))
+    level = np.where(event, level, low)
+    s['riskLevel'] = pine.gather(level, pine.last_index(seed))
+
+
+#---- Pipeline ---------------------------
+# The pipeline as a dependency graph of the named series. Each section runs one
+# block of the script: it reads `inputs` and the series of its `upstream`
+# sections, and writes `series`. A section's result depends only on its own
+# inputs and those upstream of it, see section_inputs().
+Section = namedtuple('Section', 'run inputs upstream series')
+
+SECTIONS = (
+    Section(source, ('PriceSource',), (), ('PriceSource',)),
+    Section(price_flips, ('SetupLookback',), (source,),
+            ('setupPriceUp', 'setupPriceDown', 'setupPriceEqual')),
+    Section(setup_counts, ('SetupEqualEnable',), (price_flips,),
+            ('setupCountUp', 'setupCountDown')),
+    Section(setups, ('SetupBars',), (setup_counts,),
+            ('setupSell', 'setupBuy', 'setupSellCount', 'setupBuyCount')),
+    Section(setup_perfection, ('SetupPerfLookback',), (setups,),
+            ('setupSellPerfPrice', 'setupSellPerfMask', 'setupSellPerf',
+             'setupBuyPerfPrice', 'setupBuyPerfMask', 'setupBuyPerf')),
+    Section(setup_trend, ('SetupTrendExtend', 'SetupTrendExact'), (setups,),
+            ('setupTrendSupport', 'setupTrendResist')),
+    Section(countdown_price, ('CntdwnLookback', 'CntdwnAggressive'), (source,),
+            ('cntdwnPriceUp', 'cntdwnPriceDown')),
+    Section(recycle, ('SetupBars',), (source, setup_counts),
+            ('cntdwnCountUpRecycle', 'cntdwnCountDownRecycle')),
+    Section(countdown, (), (setups, setup_trend, countdown_price, recycle),
+            ('cntdwnCountUp', 'cntdwnCountUpImp', 'cntdwnCountDown', 'cntdwnCountDownImp')),
+    Section(countdown_qualification, ('CntdwnBars', 'CntdwnQualBar'), (countdown,),
+            ('cntdwnSellQualPrice', 'cntdwnSellQualMask', 'cntdwnSellQualMaskImp',
+             'cntdwnBuyQualPrice', 'cntdwnBuyQualMask', 'cntdwnBuyQualMaskImp',
+             'cntdwnSell', 'cntdwnSellDefer', 'cntdwnBuy', 'cntdwnBuyDefer')),
+    Section(risk_level, ('SetupBars', 'CntdwnBars'), (setups, countdown_qualification),
+            ('riskLevel',)),
+)
+
+
+def section_inputs():
+    """{section function: every input its result depends on, in Params field order}."""
+    order = [f.name for f in fields(Params)]
+    inputs = {}
+    for section in SECTIONS:
+        names = set(section.inputs).union(*(inputs[u] for u in section.upstream))
+        inputs[section.run] = tuple(sorted(names, key=order.index))
+    return inputs
+
+
+def pipeline(outputs=SERIES):
+    """The sections needed for `outputs`, in run order: those writing one of them
+    and everything upstream of those."""
+    unknown = set(outputs) - set(SERIES)
+    if unknown:
+        raise ValueError('unknown series: %s' % ', '.join(sorted(unknown)))
+    needed = {section.run for section in SECTIONS if set(section.series) & set(outputs)}
+    for section in reversed(SECTIONS):
+        if section.run in needed:
+            needed.update(section.upstream)
+    return [section for section in SECTIONS if section.run in needed]
+
+
+#---- Mask state machine ---------------------------
+def _latch_mask(start, cancel, hit, done, pending, anchor=None):
+    """Closed form of the perfection/qualification mask recurrences.
+
+    The script's mask is
+        (nz(mask[1]) >= done) or cancel ? na :
+           start ? (hit ? done : pending) :
+              na(mask[1]) ? na : (hit ? done : mask[1])
+    i.e. it latches `pending` on a start bar, turns `done` on the first hit and
+    goes na on the bar after, or on a cancel bar, until the next start.
+    `anchor` is last_index(start), when the caller already has it.
+    """
+    n = len(start)
+    bar = np.arange(n)
+    if anchor is None:
+        anchor = pine.last_index(start)
+    prevHit = np.concatenate(([-1], pine.last_index(hit)[:-1]))
+    alive = (anchor >= 0) & (pine.last_index(cancel) < anchor) & (prevHit < anchor)
+    mask = np.where(alive, np.where(hit, done, pending), pine.na)
+
+    # A start bar is itself cancelled when the previous bar was `done`. That
+    # empties the whole segment, which in turn re-enables the next start, so
+    # along a chain of such starts every other one is cancelled.
+    starts = np.flatnonzero(start)
+    if len(starts):
+        blocked = np.zeros(len(starts), dtype=bool)
+        blocked[starts > 0] = mask[starts[starts > 0] - 1] == done
+        if blocked.any():
+            run = pine.run_length(blocked)
+            dead = blocked & (run % 2 == 1)
+            segment = np.searchsorted(starts, bar, side='right') - 1
+            mask[(segment >= 0) & dead[np.maximum(segment, 0)]] = pine.na
+    return mask
@@ -0,0 +1,211 @@
+"""Throughput benchmarks over seeded synthetic OHLC, with per-section timings.
+
+    python -m demark.bench --bars 1e3 1e5 1e7 --symbols 1 100 --output bench.json
+
+The batch engine is timed section by section (batch.SECTIONS), plus the TDST
+section a second time with SetupTrendExtend on. The table engine is timed per
+step across all symbols. Results are written as JSON so runs can be compared.
+
+Series longer than --chunk-size bars are never held in memory whole: the batch
+engine reads them from a temporary memmap and runs chunk by chunk
+(chunked.chunks, whose section timings include the halo runs), and the table
+engine is fed bars generated a chunk at a time.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+import numpy as np
+
+from .batch import SECTIONS, namespace, setup_trend
+from .chunked import chunks
+from .metrics import Metrics
+from .params import Params
+from .table import TDTable
+
+REGIMES = ('trend', 'chop', 'flat')
+
+
+def ohlc(n, seed=0, regime='mixed', tick=0.25):
+    """Seeded random-walk OHLC on a `tick` grid, as (open, high, low, close).
+
+    `regime` is one of REGIMES, or 'mixed' for segments of 20-120 bars each
+    drawn from all three. Trending segments drift up or down, choppy ones do
+    not, and flat ones move so little that most closes repeat, which exercises
+    setupPriceEqual and SetupEqualEnable.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(20, 121, size=n // 20 + 1)
+    if regime == 'mixed':
+        kinds = rng.integers(0, len(REGIMES), size=len(lengths))
+    else:
+        kinds = np.full(len(lengths), REGIMES.index(regime))
+    direction = rng.choice((-1.0, 1.0), size=len(lengths))
+    drift = np.repeat(np.where(kinds == 0, 0.4 * direction, 0.0), lengths)[:n]
+    volatility = np.repeat(np.where(kinds == 2, 0.2, 1.0), lengths)[:n]
+
+    close = 100.0 + np.cumsum(np.round((drift + rng.normal(0.0, 1.0, n) * volatility) * 0.5 / tick) * tick)
+    open = np.concatenate((close[:1], close[:-1]))
+    high = np.maximum(open, close) + np.round(rng.exponential(0.5, n) * volatility / tick) * tick
+    low = np.minimum(open, close) - np.round(rng.exponential(0.5, n) * volatility / tick) * tick
+    return open, high, low, close
+
+
+def walk(n, seed=0, regime='mixed', chunk_size=10 ** 7):
+    """ohlc(n, seed, regime) as consecutive chunks of up to `chunk_size` bars, each
+    continuing the walk from the last close of the one before. A single chunk is
+    ohlc() itself."""
+    last = None
+    for k, start in enumerate(range(0, n, chunk_size)):
+        bars = ohlc(min(chunk_size, n - start), seed if k == 0 else [seed, k], regime)
+        if last is not None:
+            bars = tuple(x + (last - bars[0][0]) for x in bars)
+        last = bars[3][-1]
+        yield bars
+
+
+def time_sections(open, high, low, close, params=Params()):
+    """{section name: seconds} for one batch run of the whole study."""
+    timings = {}
+    s = namespace(open, high, low, close)
+    for section in SECTIONS:
+        start = time.perf_counter()
+        section.run(s, params)
+        timings[section.run.__name__] = time.perf_counter() - start
+        if section.run is setup_trend:
+            # TDST again with the extended levels, on a scratch copy so the
+            # remaining sections still see the configured ones
+            scratch = namespace(open, high, low, close)
+            scratch.update(s)
+            start = time.perf_counter()
+            setup_trend(scratch, replace(params, SetupTrendExtend=True))
+            timings['setup_trend_extended'] = time.perf_counter() - start
+    return timings
+
+
+def time_chunked(bars, params=Params(), seed=0, regime='mixed', chunk_size=10 ** 7):
+    """time_sections() of a walk of `bars` bars, held in a temporary memmap and
+    evaluated `chunk_size` bars at a time."""
+    with tempfile.TemporaryDirectory() as work:
+        data = [np.lib.format.open_memmap(os.path.join(work, '%d.npy' % i), mode='w+', dtype=np.float64,
+                                          shape=(bars,)) for i in range(4)]
+        start = 0
+        for part in walk(bars, seed, regime, chunk_size):
+            for x, values in zip(data, part):
+                x[start:start + len(values)] = values
+            start += len(part[3])
+        metrics = Metrics()
+        for _ in chunks(*data, params, chunk_size=chunk_size, metrics=metrics):
+            pass
+        timings = dict(metrics.section_seconds)
+        metrics = Metrics()
+        for _ in chunks(*data, replace(params, SetupTrendExtend=True), ('setupTrendSupport', 'setupTrendResist'),
+                        chunk_size, metrics):
+            pass
+        timings['setup_trend_extended'] = metrics.section_seconds['setup_trend']
+        del data
+    return timings
+
+
+def bench_batch(bars, symbols, params=Params(), seed=0, regime='mixed', chunk_size=10 ** 7):
+    """Batch engine over `symbols` independent series of `bars` bars each."""
+    stages = {}
+    for symbol in range(symbols):
+        if bars <= chunk_size:
+            timings = time_sections(*ohlc(bars, seed + symbol, regime), params)
+        else:
+            timings = time_chunked(bars, params, seed + symbol, regime, chunk_size)
+        for name, seconds in timings.items():
+            stages[name] = stages.get(name, 0.0) + seconds
+    total = sum(seconds for name, seconds in stages.items() if name != 'setup_trend_extended')
+    return _result('batch', bars, symbols, regime, total, stages=stages, chunked=bars > chunk_size)
+
+
+def bench_table(bars, symbols, params=Params(), seed=0, regime='mixed', chunk_size=10 ** 7):
+    """Table engine stepping `symbols` series together for `bars` bars."""
+    # Bars are generated `chunk_size` values at a time across the symbols
+    walks = [walk(bars, seed + symbol, regime, max(chunk_size // symbols, 1)) for symbol in range(symbols)]
+    table = TDTable(symbols, params)
+    total = 0.0
+    for parts in zip(*walks):
+        data = np.stack([np.stack(part) for part in parts], axis=2)
+        start = time.perf_counter()
+        for bar in range(data.shape[1]):
+            table.update(*data[:, bar])
+        total += time.perf_counter() - start
+    return _result('table', bars, symbols, regime, total, secondsPerStep=total / bars)
+
+
+def _result(engine, bars, symbols, regime, seconds, **extra):
+    result = {
+        'engine': engine,
+        'bars': bars,
+        'symbols': symbols,
+        'regime': regime,
+        'seconds': seconds,
+        'barsPerSecond': bars * symbols / seconds if seconds else None,
+    }
+    result.update(extra)
+    return result
+
+
+ENGINES = {'batch': bench_batch, 'table': bench_table}
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m demark.bench', description=__doc__.splitlines()[0])
+    parser.add_argument('--bars', type=float, nargs='+', default=[1e3, 1e4, 1e5, 1e6],
+                        help='bars per symbol, e.g. 1e3 1e8')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[1])
+    parser.add_argument('--engine', choices=sorted(ENGINES), nargs='+', default=['batch'])
+    parser.add_argument('--regime', choices=('mixed',) + REGIMES, default='mixed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=float, default=1e7,
+                        help='longest series held in memory whole, in values')
+    parser.add_argument('--repeat', type=int, default=1, help='keep the fastest of this many runs')
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    params = Params()
+    runs = []
+    for engine in args.engine:
+        for symbols in args.symbols:
+            for bars in args.bars:
+                results = [ENGINES[engine](int(bars), symbols, params, args.seed, args.regime,
+                                           int(args.chunk_size))
+                           for _ in range(args.repeat)]
+                runs.append(min(results, key=lambda result: result['seconds']))
+                print('%-5s %10d bars x %5d symbols  %9.3f s  %12.0f bars/s' % (
+                    engine, bars, symbols, runs[-1]['seconds'], runs[-1]['barsPerSecond'] or 0), file=sys.stderr)
+
+    report = {
+        'environment': environment(),
+        'params': params.as_dict(),
+        'seed': args.seed,
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Memory-bounded LRU cache of study results, extended as new bars arrive.
+
+Entries are keyed by (symbol, Params.digest(), start), where `start` is the bar
+the supplied history begins at. Histories are taken to be append-only: asking
+again with more bars extends the cached series from their stored end state
+(see chunked), so only the new bars and a verified halo are evaluated.
+
+Every entry keeps a digest of the OHLC bytes it was computed from, extended as
+bars are appended, and each get() checks the supplied history against it: a
+history revised anywhere, or shorter than the cached one, is recomputed from
+scratch. Bytes compare na bars equal, unlike floats.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .batch import SERIES, pipeline
+from .chunked import evaluate, series_dtype
+from .params import Params
+
+
+class _Entry:
+    __slots__ = ('outputs', 'series', 'n', 'state', 'digest')
+
+    def __init__(self, outputs, series, n, state, digest):
+        self.outputs = outputs
+        self.series = series
+        self.n = n
+        self.state = state
+        self.digest = digest
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.series.values())
+
+    def extend(self, s, first, stop, state, digest):
+        """Append bars self.n:stop of the run `s` that began at bar `first`."""
+        for name, buffer in self.series.items():
+            if stop > len(buffer):
+                # Grow geometrically so appending a bar at a time stays amortized O(1)
+                grown = np.empty(max(stop, 2 * len(buffer)), dtype=buffer.dtype)
+                grown[:self.n] = buffer[:self.n]
+                buffer = self.series[name] = grown
+            buffer[self.n:stop] = s[name][self.n - first:]
+        self.n, self.state, self.digest = stop, state, digest
+
+
+class ResultCache:
+    """Study results per (symbol, params, start), evicting the least recently
+    used entries beyond `max_bytes` of cached series."""
+
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = self.extensions = self.misses = 0
+
+    def get(self, symbol, open, high, low, close, params=Params(), outputs=SERIES, start=0):
+        """{name: ndarray} over the whole supplied history, from cache where possible.
+
+        The arrays are views of the cache and must be treated as read-only.
+        """
+        n = len(close)
+        if not n:
+            return {name: np.empty(0, dtype=series_dtype(name)) for name in outputs}
+        key = (symbol, params.digest(), start)
+        wanted = frozenset(outputs)
+        bars = [np.ascontiguousarray(x, dtype=np.float64) for x in (open, high, low, close)]
+        hashes = [hashlib.blake2b(digest_size=16) for _ in bars]
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+            wanted |= entry.outputs
+            revised = n < entry.n or _update(hashes, bars, 0, entry.n) != entry.digest
+            if revised or not entry.outputs >= set(outputs):
+                entry = None
+                hashes = [hashlib.blake2b(digest_size=16) for _ in bars]
+
+        if entry is None:
+            self.misses += 1
+            s, _, state = evaluate(*bars, params, pipeline(wanted), 0, n, None)
+            entry = _Entry(wanted, {name: np.array(s[name], dtype=series_dtype(name)) for name in wanted},
+                           n, state, _update(hashes, bars, 0, n))
+        elif n > entry.n:
+            self.extensions += 1
+            s, first, state = evaluate(*bars, params, pipeline(entry.outputs), entry.n, n, entry.state)
+            entry.extend(s, first, n, state, _update(hashes, bars, entry.n, n))
+        else:
+            self.hits += 1
+
+        self.entries[key] = entry
+        self.nbytes += entry.nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return {name: entry.series[name][:n] for name in outputs}
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+
+def _update(hashes, bars, start, stop):
+    # Extend the per-field hashes with bars start:stop, returning their digests
+    for h, x in zip(hashes, bars):
+        h.update(x[start:stop])
+    return tuple(h.digest() for h in hashes)
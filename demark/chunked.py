@@ -0,0 +1,284 @@
+"""Chunked batch evaluation of histories too long to hold in memory.
+
+The series is evaluated in chunks of `chunk_size` bars, each run through the
+batch engine together with a halo of the bars before it. The study is a
+recurrence: a run started at the halo gives the same outputs as a run from
+the first bar as soon as its carried state agrees with the true one. That state
+is the script's [1]-referenced series, the valuewhen() carries that can reach
+back further than the halo, and the lookback windows of the inputs. A halo of
+at least the longest window settles the windows. The rest is checked: the
+state a run over the halo alone ends in is compared with the state the
+previous chunk ended in. When they differ, e.g. no setup fired inside the halo,
+the halo is doubled and checked again. Outputs are therefore identical
+to a single pass, and memory stays bounded by the chunk plus its halo.
+
+Inputs may be any sliceable arrays, e.g. np.memmap or np.load(..., mmap_mode='r').
+
+compute_parallel() uses the same check to split one long series across a
+process pool: every segment is evaluated at once with a speculative halo, and
+as they complete each segment's starting state is compared, in order, with the
+state the segment before it truly ended in. Only the segments that disagree are
+rerun, on the pool as well.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from . import pine, shared
+from .batch import FIELDS, SERIES, namespace, pipeline
+from .params import Params
+
+# [1]-referenced series of the script, i.e. the state it carries from bar to bar
+CARRIED = (
+    'setupCountUp', 'setupCountDown', 'setupSellCount', 'setupBuyCount',
+    'setupSellPerfPrice', 'setupSellPerfMask', 'setupBuyPerfPrice', 'setupBuyPerfMask',
+    'setupTrendSupport', 'setupTrendResist',
+    'cntdwnCountUp', 'cntdwnCountDown',
+    'cntdwnSellQualPrice', 'cntdwnSellQualMask', 'cntdwnBuyQualPrice', 'cntdwnBuyQualMask',
+    'riskLevel',
+)
+
+
+def halo(params=Params()):
+    """The shortest halo covering every lookback and highest()/lowest() window."""
+    p = params
+    ladder = p.SetupTrendExtend and not p.SetupTrendExact
+    return max(p.SetupLookback, p.CntdwnLookback, p.SetupBars, p.CntdwnBars, 10 * p.SetupBars if ladder else 0) + 1
+
+
+def chunks(open, high, low, close, params=Params(), outputs=SERIES, chunk_size=1000000, metrics=None):
+    """Evaluate the study chunk by chunk. Yields (start, {name: ndarray}) with the
+    outputs for bars start .. start + len - 1. `metrics` is an optional
+    metrics.Metrics recording the section timings, halo runs included."""
+    sections = pipeline(outputs)
+    state = None
+    for start in range(0, len(close), chunk_size):
+        stop = min(start + chunk_size, len(close))
+        s, first, state = evaluate(open, high, low, close, params, sections, start, stop, state, metrics,
+                                   carry=stop < len(close))
+        yield start, {name: s[name][start - first:] for name in outputs}
+
+
+def compute_chunked(open, high, low, close, params=Params(), outputs=SERIES, chunk_size=1000000, out=None,
+                    metrics=None):
+    """Like batch.compute(), one chunk at a time. `out` optionally maps output
+    names to preallocated arrays (e.g. writable memmaps) to fill."""
+    if out is None:
+        out = {name: np.empty(len(close), dtype=series_dtype(name)) for name in outputs}
+    for start, result in chunks(open, high, low, close, params, outputs, chunk_size, metrics):
+        for name, values in result.items():
+            out[name][start:start + len(values)] = values
+    return out
+
+
+def compute_parallel(open, high, low, close, params=Params(), outputs=SERIES, workers=None, segments=None,
+                     speculative_halo=4096, out=None):
+    """Like batch.compute(), with one series split into `segments` (default: four
+    per worker, or one for a single worker) evaluated on `workers` processes, at most one per CPU. Results
+    are exact: a segment whose speculative halo of `speculative_halo` bars did
+    not reach the carried state of the segment before it is rerun on the pool
+    with a verified halo, as soon as that state is known.
+
+    The result arrays are allocated once, or taken from `out` as in
+    compute_chunked(). Each worker fills a shared block the size of its segment,
+    copied into the result as soon as the segment is done, and at most
+    `workers` segments are in flight, so beyond the result only about
+    workers/segments of it is held at a time. With a single worker there is
+    nothing to speculate on, and the segments are evaluated as chunks.
+    """
+    n = len(close)
+    cpus = os.cpu_count() or 1
+    workers = min(workers or cpus, cpus)
+    if out is None:
+        out = {name: np.empty(n, dtype=series_dtype(name)) for name in outputs}
+    edges = np.unique(np.linspace(0, n, (segments or (4 * workers if workers > 1 else 1)) + 1).astype(np.int64))
+    tasks = [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:])]
+    if workers == 1 or len(tasks) < 2:
+        return compute_chunked(open, high, low, close, params, outputs, max(n // max(len(tasks), 1), 1), out)
+    length = max(halo(params), speculative_halo)
+
+    blocks, inFlight = [], {}
+    try:
+        inputs = {}
+        for field, array in zip(FIELDS, (open, high, low, close)):
+            inputs[field], block = shared.share(array)
+            blocks += [block] if block else []
+
+        # speculated[i]: (before, after) states of the speculative run of task i;
+        # final[i]: the true state after task i, once its outputs are exact
+        speculated, final, rerunning = [None] * len(tasks), [None] * len(tasks), [False] * len(tasks)
+        todo = list(range(len(tasks)))[::-1]
+        verified = 0
+        with ProcessPoolExecutor(min(workers, len(tasks)), initializer=shared.attach,
+                                 initargs=(inputs, {}, {'params': params})) as pool:
+
+            def submit(i, state=None):
+                start, stop = tasks[i]
+                refs, segment = _allocate(outputs, stop - start)
+                if state is None:
+                    future = pool.submit(_segment, start, stop, length, refs)
+                else:
+                    future = pool.submit(_rerun, start, stop, state, refs)
+                inFlight[future] = i, segment, state is not None
+
+            while verified < len(tasks):
+                while todo and len(inFlight) < workers:
+                    submit(todo.pop())
+                done, _ = wait(inFlight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, segment, rerun = inFlight.pop(future)
+                    try:
+                        result = future.result()
+                        start, stop = tasks[i]
+                        for name in outputs:
+                            out[name][start:stop] = segment[0][name]
+                    finally:
+                        _release(segment)
+                    if rerun:
+                        final[i] = result
+                    else:
+                        speculated[i] = result
+
+                # Verify in order: a segment is exact when it began in the state
+                # the one before it truly ended in, and is rerun from that state
+                # otherwise
+                while verified < len(tasks):
+                    i = verified
+                    if final[i] is None:
+                        if rerunning[i] or speculated[i] is None:
+                            break
+                        before, after = speculated[i]
+                        if i and not _same(before, final[i - 1]):
+                            rerunning[i] = True
+                            submit(i, final[i - 1])
+                            break
+                        final[i] = after
+                    verified += 1
+    finally:
+        for _, segment, _ in inFlight.values():
+            _release(segment)
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return out
+
+
+def _allocate(outputs, n):
+    # Shared blocks for one segment of every output: (refs, [views, blocks])
+    refs, views, blocks = {}, {}, []
+    for name in outputs:
+        refs[name], block, views[name] = shared.allocate(n, series_dtype(name))
+        blocks.append(block)
+    return refs, [views, blocks]
+
+
+def _release(segment):
+    # Views must go before their blocks can be closed
+    views, blocks = segment
+    views.clear()
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _segment(start, stop, length, refs):
+    # Worker side of compute_parallel(): evaluate bars start:stop after a
+    # speculative halo into the blocks `refs`, returning the state before and
+    # after them
+    inputs, params = shared.worker['inputs'], shared.worker['params']
+    s, first, before, after = _speculate(inputs['open'], inputs['high'], inputs['low'], inputs['close'],
+                                         params, pipeline(tuple(refs)), start, stop, length)
+    _write(s, start - first, refs)
+    return before, after
+
+
+def _rerun(start, stop, state, refs):
+    # Worker side of compute_parallel()'s fix-up: evaluate bars start:stop
+    # from the true `state` before them into the blocks `refs`, returning the
+    # state after them
+    inputs, params = shared.worker['inputs'], shared.worker['params']
+    s, first, after = evaluate(inputs['open'], inputs['high'], inputs['low'], inputs['close'],
+                               params, pipeline(tuple(refs)), start, stop, state)
+    _write(s, start - first, refs)
+    return after
+
+
+def _write(s, offset, refs):
+    # Copy the run `s` from `offset` on into the blocks `refs`
+    outputs, blocks = shared.views(refs)
+    for name in refs:
+        outputs[name][:] = s[name][offset:]
+    outputs.clear()
+    for block in blocks:
+        block.close()
+
+
+def _speculate(open, high, low, close, params, sections, start, stop, length):
+    # Run bars start:stop after `length` bars of unverified halo. Returns the
+    # run, its first bar and the states before and after bars start:stop.
+    first = max(start - length, 0)
+    s = _run(open, high, low, close, first, stop, params, sections)
+    return s, first, (_carry(s, params, start - 1 - first) if start else None), _carry(s, params, stop - 1 - first)
+
+
+def series_dtype(name):
+    """The dtype batch.compute() returns the output `name` in."""
+    if name in ('setupPriceUp', 'setupPriceDown', 'setupPriceEqual'):
+        return np.bool_
+    if name in ('setupCountUp', 'setupCountDown'):
+        return np.int64
+    return np.float64
+
+
+def evaluate(open, high, low, close, params, sections, start, stop, state, metrics=None, carry=True):
+    """Run bars start:stop after a halo verified against `state`, the carried
+    state after bar start - 1. Returns the run, its first bar and its end state
+    (None without `carry`, for a run nothing continues from)."""
+    # Grow the halo until a run over it alone ends in `state`, then run it
+    # together with the bars
+    length = halo(params)
+    while start - length > 0:
+        warm = _run(open, high, low, close, start - length, start, params, sections, metrics)
+        if _same(_carry(warm, params, length - 1), state):
+            break
+        length *= 2
+    first = max(start - length, 0)
+    s = _run(open, high, low, close, first, stop, params, sections, metrics)
+    return s, first, _carry(s, params, stop - 1 - first) if carry else None
+
+
+def _run(open, high, low, close, first, stop, params, sections, metrics=None):
+    s = namespace(open[first:stop], high[first:stop], low[first:stop], close[first:stop])
+    for section in sections:
+        if metrics is None:
+            section.run(s, params)
+        else:
+            start = time.perf_counter()
+            section.run(s, params)
+            metrics.section(section.run.__name__, time.perf_counter() - start)
+    return s
+
+
+def _carry(s, p, t):
+    """The carried state of the run `s` after its bar t."""
+    state = [s[name][t] for name in CARRIED if name in s]
+    if 'setupTrendSupport' in s and p.SetupTrendExtend and p.SetupTrendExact:
+        # Low (high) since the last sell (buy) setup, the next exact TDST candidate
+        for setup, x, extreme in (('setupSell', 'low', np.min), ('setupBuy', 'high', np.max)):
+            since = pine.last_index(pine.truthy(s[setup][:t + 1]))[-1]
+            state.append(extreme(s[x][max(since, 0):t + 1]))
+    if 'riskLevel' in s:
+        # tr of the last bar that was its own highest()/lowest() window extreme
+        tr = pine.true_range(s['high'][:t + 1], s['low'][:t + 1], s['close'][:t + 1])
+        for length in (p.SetupBars, p.CntdwnBars):
+            for x, maximum in (('high', True), ('low', False)):
+                _, index = pine.rolling_extreme(s[x][:t + 1], length, maximum)
+                state.append(tr[index[-1]] if index[-1] >= 0 else pine.na)
+    return state
+
+
+def _same(a, b):
+    return b is not None and len(a) == len(b) and all(x == y or (x != x and y != y) for x, y in zip(a, b))
@@ -0,0 +1,69 @@
+"""Sparse event log: the study's signals as a compact record array.
+
+Outside the counters nearly every output is na on most bars. An event log keeps
+one EVENT_DTYPE record per firing instead: the eight alertcondition() signals
+plus the deferred Sell/Buy Countdowns.
+"""
+
+import numpy as np
+
+from . import pine
+from .batch import compute
+from .params import Params
+
+# (series, title, series giving the record's count). Kinds index this table; the
+# first eight are batch.ALERTS in order.
+EVENTS = (
+    ('setupSell', 'Sell Setup', 'setupCountUp'),
+    ('setupSellPerf', 'Sell Setup Perfected', 'setupCountUp'),
+    ('setupBuy', 'Buy Setup', 'setupCountDown'),
+    ('setupBuyPerf', 'Buy Setup Perfected', 'setupCountDown'),
+    ('cntdwnSell', 'Sell Countdown', 'cntdwnCountUp'),
+    ('cntdwnBuy', 'Buy Countdown', 'cntdwnCountDown'),
+    ('cntdwnCountUpRecycle', 'Countdown Recycle Up', 'setupCountUp'),
+    ('cntdwnCountDownRecycle', 'Countdown Recycle Down', 'setupCountDown'),
+    ('cntdwnSellDefer', 'Sell Countdown Deferred', 'cntdwnCountUp'),
+    ('cntdwnBuyDefer', 'Buy Countdown Deferred', 'cntdwnCountDown'),
+)
+
+# bar: bar index, kind: index in EVENTS, price: the series value (PriceSource on
+# that bar), count: the setup or countdown count on that bar, which grows with
+# the bars until a cancel or recycle, so it is as wide as bar
+EVENT_DTYPE = np.dtype([('bar', '<i8'), ('kind', 'u1'), ('price', '<f8'), ('count', '<i8')])
+
+SOURCES = tuple(dict.fromkeys(name for event in EVENTS for name in (event[0], event[2])))
+
+
+def kind(series):
+    """The event kind of a series name."""
+    return [event[0] for event in EVENTS].index(series)
+
+
+def from_series(s, start=0):
+    """Event log of a {series name: array} mapping holding SOURCES.
+
+    Records are ordered by bar, then kind. `start` is the bar index of the first
+    element, for series that are a window of a longer history.
+    """
+    bars, kinds, prices, counts = [], [], [], []
+    for k, (name, _, countName) in enumerate(EVENTS):
+        at = np.flatnonzero(pine.truthy(np.asarray(s[name], dtype=np.float64)))
+        bars.append(at)
+        kinds.append(np.full(len(at), k))
+        prices.append(np.asarray(s[name], dtype=np.float64)[at])
+        counts.append(pine.nz(np.asarray(s[countName], dtype=np.float64)[at]))
+    bars = np.concatenate(bars)
+    kinds = np.concatenate(kinds)
+    order = np.lexsort((kinds, bars))
+    log = np.empty(len(order), dtype=EVENT_DTYPE)
+    log['bar'] = bars[order] + start
+    log['kind'] = kinds[order]
+    log['price'] = np.concatenate(prices)[order]
+    log['count'] = np.concatenate(counts)[order]
+    return log
+
+
+def compute_events(open, high, low, close, params=Params()):
+    """Run the study and return its event log, skipping riskLevel."""
+    return from_series(compute(open, high, low, close, params, SOURCES))
+
@@ -0,0 +1,160 @@
+"""Optional instrumentation of the engines.
+
+A Metrics collects, for the engines it is passed to:
+  - wall time and run count of every batch section (batch.SECTIONS)
+  - bars processed, per engine
+  - alertcondition() signals fired, per alert
+  - a latency histogram of TDStream/TDTable update() calls
+  - latency histograms of query server requests, split into time queued
+    (batching window, pool backlog, transfer) and time computing
+
+Instrumentation is opt-in per engine (`metrics=` argument). Without it the
+batch engine does one `is None` test per section, and TDStream/TDTable keep
+their plain update(): the timed one is only bound when a Metrics is given.
+
+Counters export as Prometheus text format (to_prometheus()), or to a file with
+write(), e.g. for node_exporter's textfile collector.
+"""
+
+import json
+import math
+import os
+import tempfile
+from bisect import bisect_left
+
+import numpy as np
+
+from . import pine
+from .batch import ALERTS
+
+# Upper bounds of the update() and request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 1e-1,
+                   2.5e-1, 1.0, 10.0)
+
+_ALERT_NAMES = tuple(name for name, _ in ALERTS)
+
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS, prefix='demark'):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.section_seconds = {}
+        self.section_runs = {}
+        self.bars = {}
+        self.events = dict.fromkeys(_ALERT_NAMES, 0)
+        # engine: [per-bucket counts (the last is +Inf), sum of seconds]
+        self.latency = {}
+        # stage ('queue', 'compute'): the same, for server requests
+        self.requests = {}
+
+    def section(self, name, seconds):
+        self.section_seconds[name] = self.section_seconds.get(name, 0.0) + seconds
+        self.section_runs[name] = self.section_runs.get(name, 0) + 1
+
+    def batch(self, s, bars):
+        """Count a batch run over `bars` bars whose namespace is `s`."""
+        self.bars['batch'] = self.bars.get('batch', 0) + bars
+        for name in _ALERT_NAMES:
+            if name in s:
+                self.events[name] += int(np.count_nonzero(pine.truthy(s[name])))
+
+    def stream(self, seconds, out):
+        """Count one TDStream.update() that took `seconds` and returned `out`."""
+        self.bars['stream'] = self.bars.get('stream', 0) + 1
+        self._observe(self.latency, 'stream', seconds)
+        events = self.events
+        for name in _ALERT_NAMES:
+            value = out[name]
+            if value == value and value != 0:
+                events[name] += 1
+
+    def table(self, seconds, out, symbols):
+        """Count one TDTable.update() over `symbols` symbols."""
+        self.bars['table'] = self.bars.get('table', 0) + symbols
+        self._observe(self.latency, 'table', seconds)
+        for name in _ALERT_NAMES:
+            self.events[name] += int(np.count_nonzero(pine.truthy(out[name])))
+
+    def request(self, queued, computing):
+        """Count one server request that waited `queued` and computed `computing` seconds."""
+        self._observe(self.requests, 'queue', queued)
+        self._observe(self.requests, 'compute', computing)
+
+    def _observe(self, histograms, key, seconds):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        histogram[0][bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+
+    def as_dict(self):
+        return {
+            'sectionSeconds': dict(self.section_seconds),
+            'sectionRuns': dict(self.section_runs),
+            'bars': dict(self.bars),
+            'events': dict(self.events),
+            'latency': {engine: {'buckets': list(self.buckets), 'counts': list(counts), 'sum': total}
+                        for engine, (counts, total) in self.latency.items()},
+            'requests': {stage: {'buckets': list(self.buckets), 'counts': list(counts), 'sum': total}
+                         for stage, (counts, total) in self.requests.items()},
+        }
+
+    def to_prometheus(self):
+        """The counters in Prometheus text exposition format."""
+        p = self.prefix
+        lines = []
+
+        def family(name, kind, help, samples):
+            lines.append('# HELP %s_%s %s' % (p, name, help))
+            lines.append('# TYPE %s_%s %s' % (p, name, kind))
+            for suffix, labels, value in samples:
+                label = ','.join('%s="%s"' % item for item in labels)
+                lines.append('%s_%s%s%s %s' % (p, name, suffix, '{%s}' % label if label else '', _number(value)))
+
+        family('section_seconds_total', 'counter', 'Wall time spent in each batch section.',
+               [('', [('section', name)], value) for name, value in self.section_seconds.items()])
+        family('section_runs_total', 'counter', 'Batch section evaluations.',
+               [('', [('section', name)], value) for name, value in self.section_runs.items()])
+        family('bars_total', 'counter', 'Bars processed, per engine (symbol-bars for the table engine).',
+               [('', [('engine', engine)], value) for engine, value in self.bars.items()])
+        family('events_total', 'counter', 'alertcondition() signals fired.',
+               [('', [('alert', name)], value) for name, value in self.events.items()])
+
+        def histogram(label, histograms):
+            samples = []
+            for key, (counts, total) in histograms.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += count
+                    samples.append(('_bucket', [(label, key), ('le', _number(bound))], cumulative))
+                samples.append(('_sum', [(label, key)], total))
+                samples.append(('_count', [(label, key)], cumulative))
+            return samples
+
+        family('update_seconds', 'histogram', 'Latency of streaming update() calls.',
+               histogram('engine', self.latency))
+        family('request_seconds', 'histogram', 'Query server request latency, queued and computing.',
+               histogram('stage', self.requests))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically write the counters to `path`: JSON for a .json path,
+        Prometheus text format otherwise."""
+        if path.endswith('.json'):
+            text = json.dumps(self.as_dict(), indent=2)
+        else:
+            text = self.to_prometheus()
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
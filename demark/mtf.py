@@ -0,0 +1,92 @@
+"""Several timeframes from one base-bar stream.
+
+MultiTimeframe aggregates base bars (e.g. 1m) into every configured timeframe
+as they arrive and drives an independent TDStream (or, for a universe of
+symbols advancing together, TDTable) per timeframe. Only the base bars are
+ingested. Each aggregated bar reaches its engine once, when it closes, so its
+PriceSource (hlc3, ohlc4, ...) is computed once from the aggregated OHLC.
+
+Buckets are aligned to `offset` seconds after the epoch, e.g. offset=-5 * 3600
+for daily bars starting at midnight in UTC-5. A bar closes with the base bar
+that ends its bucket, or, after a gap in the data, when the first base bar of a
+later bucket arrives.
+
+    mtf = MultiTimeframe({'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '1D': 86400})
+    for time, o, h, l, c in bars:
+        for timeframe, start, out in mtf.update(time, o, h, l, c):
+            ...
+"""
+
+from functools import partial
+
+import numpy as np
+
+from .params import Params
+from .stream import TDStream
+from .table import TDTable
+
+
+class _Frame:
+    __slots__ = ('seconds', 'engine', 'bucket', 'open', 'high', 'low', 'close')
+
+    def __init__(self, seconds, engine):
+        self.seconds = seconds
+        self.engine = engine
+        self.bucket = None
+
+
+class MultiTimeframe:
+    """TD Sequential on every timeframe of `timeframes` ({name: seconds}), fed
+    base bars of `base` seconds. With `symbols`, bars are arrays over that many
+    symbols and each timeframe runs a TDTable."""
+
+    def __init__(self, timeframes, base=60, params=Params(), symbols=None, offset=0):
+        for name, seconds in timeframes.items():
+            if seconds % base:
+                raise ValueError('timeframe %s of %ds is not a multiple of the %ds base bar' % (name, seconds, base))
+        self.base = base
+        self.offset = offset
+        self.symbols = symbols
+        self.frames = {name: _Frame(seconds, TDStream(params) if symbols is None else TDTable(symbols, params))
+                       for name, seconds in timeframes.items()}
+        self._max, self._min = (max, min) if symbols is None else (np.maximum, np.minimum)
+        # Arrays are copied: a caller may refill the same buffers for the next bar
+        self._copy = float if symbols is None else partial(np.array, dtype=np.float64)
+
+    def update(self, time, open, high, low, close):
+        """Add the base bar opening at `time` (epoch seconds).
+
+        Returns [(timeframe, bar start time, outputs)] for every aggregated bar
+        that closed, in order. outputs is the engine's update() result.
+        """
+        closed = []
+        elapsed = time - self.offset
+        for name, frame in self.frames.items():
+            bucket = elapsed // frame.seconds
+            if frame.bucket is not None and bucket != frame.bucket:
+                closed.append(self._close(name, frame))
+            if frame.bucket is None:
+                frame.bucket = bucket
+                frame.open, frame.high, frame.low = self._copy(open), self._copy(high), self._copy(low)
+            else:
+                frame.high = self._max(frame.high, high)
+                frame.low = self._min(frame.low, low)
+            frame.close = self._copy(close)
+            if (elapsed + self.base) % frame.seconds == 0:
+                closed.append(self._close(name, frame))
+        return closed
+
+    def preview(self):
+        """{timeframe: outputs} for the bars still forming, as if they closed now."""
+        return {name: frame.engine.preview(frame.open, frame.high, frame.low, frame.close)
+                for name, frame in self.frames.items() if frame.bucket is not None}
+
+    def flush(self):
+        """Close every forming bar, e.g. at the end of the data."""
+        return [self._close(name, frame) for name, frame in self.frames.items() if frame.bucket is not None]
+
+    def _close(self, name, frame):
+        out = frame.engine.update(frame.open, frame.high, frame.low, frame.close)
+        start = frame.bucket * frame.seconds + self.offset
+        frame.bucket = None
+        return name, start, out
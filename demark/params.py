@@ -0,0 +1,90 @@
+"""User inputs of the TD Sequential study, mirroring the input() block of tdsequential.py.
+
+Field names are kept identical to the Pine inputs (uppercase = user input) so the
+Python engines can be read side by side with the script. Plot-only inputs
+(show/hide flags, Transp) have no effect on the computed series and are omitted.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+
+# Pine built-in price sources accepted by "Price: Source"
+PRICE_SOURCES = {
+    'open': lambda o, h, l, c: o,
+    'high': lambda o, h, l, c: h,
+    'low': lambda o, h, l, c: l,
+    'close': lambda o, h, l, c: c,
+    'hl2': lambda o, h, l, c: (h + l) / 2,
+    'hlc3': lambda o, h, l, c: (h + l + c) / 3,
+    'ohlc4': lambda o, h, l, c: (o + h + l + c) / 4,
+    'hlcc4': lambda o, h, l, c: (h + l + c + c) / 4,
+}
+
+# (minval, maxval) of the integer inputs, as declared in the script
+_INPUT_RANGES = {
+    'SetupBars': (4, 31),
+    'SetupLookback': (1, 14),
+    'SetupPerfLookback': (1, 14),
+    'CntdwnBars': (3, 31),
+    'CntdwnLookback': (1, 30),
+    'CntdwnQualBar': (3, 30),
+}
+
+
+@dataclass(frozen=True)
+class Params:
+    """Study inputs. Defaults are the script's defval settings."""
+
+    PriceSource: str = 'close'
+    SetupBars: int = 9
+    SetupLookback: int = 4
+    SetupEqualEnable: bool = False
+    SetupPerfLookback: int = 3
+    SetupTrendExtend: bool = False
+    # Not a script input: with SetupTrendExtend, take the exact low/high since the
+    # previous same-direction setup instead of the script's capped k*SetupBars ladder
+    SetupTrendExact: bool = False
+    CntdwnBars: int = 13
+    CntdwnLookback: int = 2
+    CntdwnQualBar: int = 8
+    CntdwnAggressive: bool = False
+
+    def __post_init__(self):
+        if self.PriceSource not in PRICE_SOURCES:
+            raise ValueError('unknown PriceSource %r, expected one of %s'
+                             % (self.PriceSource, ', '.join(sorted(PRICE_SOURCES))))
+        for name, (lo, hi) in _INPUT_RANGES.items():
+            value = getattr(self, name)
+            if not lo <= value <= hi:
+                raise ValueError('%s=%r outside input range [%d, %d]' % (name, value, lo, hi))
+
+    @classmethod
+    def from_dict(cls, values):
+        """Params from decoded JSON (or other untyped) inputs. Unlike
+        Params(**values), every value must already be of its field's type: a bool
+        is true or false, not "false" or 0, and an int is not 9.5, "9" or true."""
+        types = {f.name: f.type for f in fields(cls)}
+        for name, value in values.items():
+            if name not in types:
+                raise TypeError('unknown input %r' % (name,))
+            if type(value) is not types[name]:
+                raise TypeError('%s=%r is not a %s' % (name, value, types[name].__name__))
+        return cls(**values)
+
+    def as_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    def digest(self):
+        """Canonical hash of the inputs, stable across processes and runs."""
+        return hashlib.sha1(json.dumps(self.as_dict(), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def price_source(open, high, low, close, name):
+    """Return the PriceSource series `name` built from OHLC arrays."""
+    if name not in PRICE_SOURCES:
+        raise ValueError('unknown PriceSource %r' % (name,))
+    return np.asarray(PRICE_SOURCES[name](open, high, low, close), dtype=np.float64)
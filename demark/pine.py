@@ -0,0 +1,194 @@
+"""Vectorized equivalents of the Pine built-ins used by tdsequential.py.
+
+Conventions follow Pine v3:
+  - na is NaN. A comparison with an na operand is na, which is false as a
+    condition. Comparisons are kept as bool (na -> False) except where the
+    script tests their na-ness with na(): cntdwnPriceUp/Down stay float with
+    na, see batch._na_bool.
+  - A float used as a condition (e.g. `setupSell ? ...`) is true when it is
+    neither na nor zero, see truthy().
+  - series[n] on the first n bars is na.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+na = np.nan
+
+
+def isna(x):
+    return np.isnan(x)
+
+
+def nz(x, replacement=0.0):
+    """nz(x, replacement): replace na values."""
+    x = np.asarray(x, dtype=np.float64)
+    return np.where(np.isnan(x), replacement, x)
+
+
+def truthy(x):
+    """Pine's implicit float -> bool conversion."""
+    x = np.asarray(x)
+    if x.dtype == np.bool_:
+        return x
+    return ~np.isnan(x) & (x != 0)
+
+
+def shift(x, n):
+    """x[n], the history reference operator. Lagged-in values are na."""
+    x = np.asarray(x, dtype=np.float64)
+    if n == 0:
+        return x.copy()
+    out = np.full_like(x, na)
+    if n < len(x):
+        out[n:] = x[:-n]
+    return out
+
+
+def last_index(cond):
+    """Bar index of the last bar (at or before each bar) where cond held, -1 if none."""
+    cond = np.asarray(cond, dtype=bool)
+    return np.maximum.accumulate(np.where(cond, np.arange(len(cond)), -1))
+
+
+def gather(src, index):
+    """src[index], na where index is -1."""
+    src = np.asarray(src, dtype=np.float64)
+    return np.where(index >= 0, src[np.maximum(index, 0)], na)
+
+
+def valuewhen(cond, src):
+    """valuewhen(cond, src, 0)."""
+    return gather(src, last_index(cond))
+
+
+class WhenIndex:
+    """Memoized last_index() over the named series of one run.
+
+    A condition is written (name, op, value), e.g. ('setupCountUp', '==', 9), where
+    value is a constant or the name of another series. Each distinct condition is
+    scanned once and shared, so every valuewhen() on it is a single gather.
+    """
+
+    OPS = {
+        '==': np.equal,
+        '>': np.greater,
+        '<': np.less,
+        '>=': np.greater_equal,
+        '<=': np.less_equal,
+    }
+
+    def __init__(self, series):
+        self.series = series
+        self.cache = {}
+
+    def last(self, name, op, value):
+        key = (name, op, value)
+        index = self.cache.get(key)
+        if index is None:
+            other = self.series[value] if isinstance(value, str) else value
+            index = self.cache[key] = last_index(self.OPS[op](self.series[name], other))
+        return index
+
+    def valuewhen(self, name, op, value, src):
+        """valuewhen(name op value, src, 0)."""
+        return gather(src, self.last(name, op, value))
+
+
+def barssince(cond):
+    """barssince(cond), na before the first occurrence."""
+    idx = last_index(truthy(cond))
+    return np.where(idx >= 0, np.arange(len(idx)) - idx, na)
+
+
+def run_length(cond):
+    """Length of the current run of consecutive true bars, 0 on false bars."""
+    cond = np.asarray(cond, dtype=bool)
+    idx = np.arange(len(cond))
+    return np.where(cond, idx - last_index(~cond), 0)
+
+
+def stair(value, event, index=None):
+    """`event ? value : nz(series[1])`, the stair-step idiom of the script.
+
+    The series takes `value` on event bars and carries it forward. An na value is
+    kept on its own event bar, then nz() turns it into 0 for the following bars.
+    `index` is last_index(event), when the caller already has it.
+    """
+    value = np.asarray(value, dtype=np.float64)
+    carried = gather(nz(value), last_index(event) if index is None else index)
+    return np.where(event, value, nz(shift(carried, 1)))
+
+
+def lowest(x, length):
+    """lowest(x, length), na until `length` bars are available."""
+    return _rolling(x, length, np.minimum)
+
+
+def highest(x, length):
+    """highest(x, length), na until `length` bars are available."""
+    return _rolling(x, length, np.maximum)
+
+
+def rolling_extreme(x, length, maximum=True):
+    """highest(x, length) (or lowest), and the bar valuewhen(x == highest(x, length))
+    refers to.
+
+    That bar is the last one whose x was the extreme of its own window, which is
+    not always the bar holding the extreme of the current window: an older, higher
+    bar may have been dropping out of the window when the current maximum
+    printed. The script reads the risk-level tr from that bar, so this keeps
+    the valuewhen() semantics for parity rather than indexing the window extreme.
+    x >= extreme matches x == extreme here, since x can only reach the extreme
+    of a window that contains it by being that extreme.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if maximum:
+        extreme = highest(x, length)
+        return extreme, last_index(x >= extreme)
+    extreme = lowest(x, length)
+    return extreme, last_index(x <= extreme)
+
+
+def lowest_at(x, length, index):
+    """lowest(x, length) evaluated only on the bars in `index`."""
+    return _rolling_at(x, length, index, np.min)
+
+
+def highest_at(x, length, index):
+    """highest(x, length) evaluated only on the bars in `index`."""
+    return _rolling_at(x, length, index, np.max)
+
+
+def true_range(high, low, close):
+    """tr, na on the first bar."""
+    prev = shift(close, 1)
+    return np.maximum(high - low, np.maximum(np.abs(high - prev), np.abs(low - prev)))
+
+
+def _rolling(x, length, extreme):
+    # van Herk/Gil-Werman: split x into blocks of `length` and take the running
+    # extreme forward and backward within each block. Every window spans at most
+    # two blocks, the tail of one and the head of the next, so its extreme is
+    # extreme(backward[i], forward[i + length - 1]): O(n) whatever the length.
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    out = np.full_like(x, na)
+    if length <= n:
+        blocks = np.full(-(-n // length) * length, na)
+        blocks[:n] = x
+        blocks = blocks.reshape(-1, length)
+        forward = extreme.accumulate(blocks, axis=1).ravel()
+        backward = extreme.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+        out[length - 1:] = extreme(backward[:n - length + 1], forward[length - 1:n])
+    return out
+
+
+def _rolling_at(x, length, index, reduce):
+    x = np.asarray(x, dtype=np.float64)
+    index = np.asarray(index, dtype=np.int64)
+    out = np.full(len(index), na)
+    ok = index >= length - 1
+    if ok.any():
+        out[ok] = reduce(sliding_window_view(x, length)[index[ok] - length + 1], axis=1)
+    return out
@@ -0,0 +1,109 @@
+"""Universe scanner: the batch engine over many symbols on a process pool.
+
+The universe is columnar: one contiguous float64 array per OHLC field, with
+symbol i occupying bars offsets[i]:offsets[i+1]. Workers never receive bar data
+through pickling. np.memmap inputs are reopened from their file, anything else
+is copied once into shared memory. Results are written by the workers straight
+into shared output arrays:
+  - flags: uint8 per bar, bit i set when ALERTS[i] fires on that bar
+  - setupTrendSupport, setupTrendResist: float64 per bar
+"""
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import pine, shared
+from .batch import ALERTS, FIELDS, compute
+from .params import Params
+
+OUTPUTS = tuple(name for name, _ in ALERTS) + ('setupTrendSupport', 'setupTrendResist')
+
+ScanResult = namedtuple('ScanResult', 'flags setupTrendSupport setupTrendResist offsets workers')
+
+
+def flag(series):
+    """Bit mask of an alert series name in ScanResult.flags."""
+    return 1 << [name for name, _ in ALERTS].index(series)
+
+
+def scan(bars, offsets, params=Params(), workers=None, shards_per_worker=4):
+    """Run the study on every symbol of a columnar universe.
+
+    bars: mapping of 'open', 'high', 'low', 'close' to equally long float64 arrays
+    offsets: symbol boundaries, length symbols + 1
+    Returns a ScanResult. ScanResult.workers holds per-worker throughput:
+    {pid: {'symbols', 'bars', 'seconds', 'barsPerSecond'}}.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    workers = workers or os.cpu_count() or 1
+    n = int(offsets[-1])
+
+    blocks, views = [], {}
+    try:
+        inputs = {}
+        for field in FIELDS:
+            ref, block = shared.share(bars[field])
+            inputs[field] = ref
+            blocks += [block] if block else []
+        outputs = {}
+        for name, dtype in (('flags', np.uint8), ('setupTrendSupport', np.float64), ('setupTrendResist', np.float64)):
+            outputs[name], block, views[name] = shared.allocate(n, dtype)
+            blocks.append(block)
+
+        shards = _shards(offsets, workers * shards_per_worker)
+        if workers == 1 or not shards:
+            shared.attach(inputs, outputs, {'offsets': offsets, 'params': params})
+            stats = [_scan_shard(lo, hi) for lo, hi in shards]
+        else:
+            with ProcessPoolExecutor(workers, initializer=shared.attach,
+                                     initargs=(inputs, outputs, {'offsets': offsets, 'params': params})) as pool:
+                stats = list(pool.map(_scan_shard, *zip(*shards)))
+
+        result = {name: values.copy() for name, values in views.items()}
+    finally:
+        # Views must go before their blocks can be closed
+        views.clear()
+        shared.detach()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    perWorker = {}
+    for pid, symbols, count, seconds in stats:
+        w = perWorker.setdefault(pid, {'symbols': 0, 'bars': 0, 'seconds': 0.0})
+        w['symbols'] += symbols
+        w['bars'] += count
+        w['seconds'] += seconds
+    for w in perWorker.values():
+        w['barsPerSecond'] = w['bars'] / w['seconds'] if w['seconds'] else 0.0
+    return ScanResult(result['flags'], result['setupTrendSupport'], result['setupTrendResist'],
+                      offsets, perWorker)
+
+
+def _shards(offsets, count):
+    # Contiguous symbol ranges of roughly equal bar counts
+    count = max(1, min(count, len(offsets) - 1))
+    cuts = np.searchsorted(offsets, np.linspace(0, offsets[-1], count + 1)[1:-1])
+    edges = np.unique(np.concatenate(([0], cuts, [len(offsets) - 1])))
+    return [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def _scan_shard(lo, hi):
+    start = time.perf_counter()
+    worker = shared.worker
+    inputs, outputs = worker['inputs'], worker['outputs']
+    offsets, params = worker['offsets'], worker['params']
+    for i in range(lo, hi):
+        a, b = offsets[i], offsets[i + 1]
+        s = compute(*(inputs[field][a:b] for field in FIELDS), params, OUTPUTS)
+        flags = np.zeros(b - a, dtype=np.uint8)
+        for bit, (name, _) in enumerate(ALERTS):
+            flags |= pine.truthy(s[name]).astype(np.uint8) << bit
+        outputs['flags'][a:b] = flags
+        outputs['setupTrendSupport'][a:b] = s['setupTrendSupport']
+        outputs['setupTrendResist'][a:b] = s['setupTrendResist']
+    return os.getpid(), hi - lo, int(offsets[hi] - offsets[lo]), time.perf_counter() - start
@@ -0,0 +1,117 @@
+"""Live screener: an inverted index over the current state of a universe.
+
+Screener keeps, for each state series in FIELDS, a map from value to the set of
+symbols currently at that value. Each update() takes the outputs of a
+TDTable.update() and moves only the symbols whose value changed, grouped by
+value so the work per bar is a few set operations per distinct value rather
+than Python per symbol. A query like "setupCountUp in (8, 9)" costs the size
+of its answer:
+
+    screener = Screener(symbols)
+    out = table.update(open, high, low, close)
+    screener.update(out, close)
+    screener.where('setupCountUp', 8, 9)
+    screener.where('cntdwnCountUp', 12) & screener.where('cntdwnSellQualMask', cntdwnIsDeferred)
+    screener.near('setupTrendSupport', 0.01)
+
+na values are indexed under None. near() searches the symbols kept sorted by
+the relative distance of their price from a TDST level; each update re-sorts
+only the symbols whose distance moved and merges them back in.
+"""
+
+import numpy as np
+
+FIELDS = (
+    'setupCountUp', 'setupCountDown',
+    'cntdwnCountUp', 'cntdwnCountDown',
+    'setupSellPerfMask', 'setupBuyPerfMask',
+    'cntdwnSellQualMask', 'cntdwnBuyQualMask',
+)
+
+LEVELS = ('setupTrendSupport', 'setupTrendResist')
+
+
+class Screener:
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        n = len(self.symbols)
+        self.values = {field: np.full(n, np.nan) for field in FIELDS}
+        self.index = {field: {None: set(range(n))} for field in FIELDS}
+        # Per level: the distance of every symbol (inf without a level), and the
+        # symbols with one sorted by it
+        self.current = {level: np.full(n, np.inf) for level in LEVELS}
+        self.distance = {level: (np.empty(0), np.empty(0, dtype=np.int64)) for level in LEVELS}
+
+    def update(self, out, price):
+        """Index the state after a bar: `out` is a TDTable.update() result and
+        `price` the prices near() measures from (e.g. close), one per symbol."""
+        for field in FIELDS:
+            new = np.asarray(out[field], dtype=np.float64)
+            old = self.values[field]
+            changed = np.flatnonzero((new != old) & ~(np.isnan(new) & np.isnan(old)))
+            if len(changed):
+                index = self.index[field]
+                for key, members in _groups(old[changed], changed):
+                    bucket = index[key]
+                    bucket.difference_update(members)
+                    if not bucket:
+                        del index[key]
+                for key, members in _groups(new[changed], changed):
+                    index.setdefault(key, set()).update(members)
+            self.values[field] = new.copy()
+
+        price = np.asarray(price, dtype=np.float64)
+        for level in LEVELS:
+            value = np.asarray(out[level], dtype=np.float64)
+            # nz() turns a missing TDST level into 0, which has no distance
+            with np.errstate(divide='ignore', invalid='ignore'):
+                current = np.abs(price / value - 1)
+            current[~(value > 0) | np.isnan(current)] = np.inf
+            changed = np.flatnonzero(current != self.current[level])
+            self.current[level] = current
+            if not len(changed):
+                continue
+            distance, symbols = self.distance[level]
+            moved = np.zeros(len(current), dtype=bool)
+            moved[changed] = True
+            keep = ~moved[symbols]
+            distance, symbols = distance[keep], symbols[keep]
+            added = changed[np.isfinite(current[changed])]
+            added = added[np.argsort(current[added], kind='stable')]
+            at = np.searchsorted(distance, current[added], side='right')
+            self.distance[level] = np.insert(distance, at, current[added]), np.insert(symbols, at, added)
+
+    def where(self, field, *values):
+        """Symbols whose `field` currently equals one of `values`."""
+        index = self.index[field]
+        found = set()
+        for value in values:
+            found.update(index.get(_key(value), ()))
+        return {self.symbols[i] for i in found}
+
+    def near(self, level, fraction):
+        """Symbols whose price is within `fraction` (0.01 = 1%) of their `level`."""
+        distance, symbols = self.distance[level]
+        return {self.symbols[i] for i in symbols[:np.searchsorted(distance, fraction, side='right')].tolist()}
+
+    def counts(self, field):
+        """{value: number of symbols} of `field`."""
+        return {value: len(symbols) for value, symbols in self.index[field].items()}
+
+
+def _groups(values, symbols):
+    # [(index key, [symbols])] of the symbols at each distinct value
+    na = np.isnan(values)
+    groups = [(None, symbols[na].tolist())] if na.any() else []
+    order = np.flatnonzero(~na)
+    order = order[np.argsort(values[order], kind='stable')]
+    keys, starts = np.unique(values[order], return_index=True)
+    for key, members in zip(keys.tolist(), np.split(symbols[order], starts[1:])):
+        groups.append((key, members.tolist()))
+    return groups
+
+
+def _key(value):
+    if value is None or value != value:
+        return None
+    return float(value)
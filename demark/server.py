@@ -0,0 +1,305 @@
+"""Asyncio query server for on-demand study runs over a bar store.
+
+Clients ask for the study over a bar range of one symbol of a BarStore (see
+store), as JSON lines over TCP or a Unix socket:
+
+    {"id": 1, "symbol": "AAPL", "inputs": {"SetupBars": 9}, "start": -500, "outputs": ["setupCountUp"]}
+
+start/stop index the symbol's bars like a Python slice (stop defaults to the
+end). inputs are Params fields, each of the field's JSON type, and outputs
+batch.SERIES names, by default all.
+Each request is answered on its connection, in completion order:
+
+    {"id": 1, "start": 4500, "stop": 5000, "queueSeconds": ..., "computeSeconds": ...,
+     "series": {"setupCountUp": [...]}}
+
+or {"id": 1, "error": "..."}. na is null.
+
+Requests are served as follows:
+  - identical requests in flight share one computation
+  - requests arriving within `window` seconds of the first waiting one (up to
+    `max_batch`) form a batch, split by symbol into up to `workers` pool tasks.
+    A symbol is evaluated by batch.compute() over its whole history at once,
+    which for ranges of many bars is far faster than stepping a TDTable over
+    the symbols bar by bar
+  - workers open the store themselves, so requests carry no bar data, and keep
+    a cache.ResultCache of `cache_bytes` over it: the study over a symbol's
+    stored history is computed once per Params and then sliced
+  - responses are JSON-encoded on the pool too, so a large one does not stall
+    the event loop
+  - computeSeconds is the time the task spent in its worker, queueSeconds the
+    rest of the request's latency (batching window, pool backlog, transfer)
+
+    async with QueryServer('bars/') as server:
+        await server.listen(port=8765)
+        ...
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .batch import SERIES
+from .cache import ResultCache
+from .params import Params
+from .store import BarStore
+
+log = logging.getLogger(__name__)
+
+Answer = namedtuple('Answer', 'series start stop queued computing')
+
+
+class QueryServer:
+    """Coalescing, batching front end of a process pool over `store` (a
+    BarStore or its path). Each worker caches up to `cache_bytes` of results.
+    `metrics` (a metrics.Metrics) records the queueing and compute latency of
+    every request."""
+
+    def __init__(self, store, workers=None, window=0.002, max_batch=64, metrics=None, cache_bytes=256 * 2 ** 20):
+        self.store = store if isinstance(store, BarStore) else BarStore(store)
+        self.workers = workers or os.cpu_count() or 1
+        self.window = window
+        self.max_batch = max_batch
+        self.metrics = metrics
+        self.cache_bytes = cache_bytes
+        self.requests = self.coalesced = self.batches = 0
+        self._pool = None
+        self._inflight = {}
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._servers = []
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start(self):
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_open_store,
+                                         initargs=(self.store.path, self.cache_bytes))
+
+    async def listen(self, host=None, port=None, path=None):
+        """Accept JSON-lines clients on TCP (host, port) or the Unix socket `path`."""
+        if path:
+            server = await asyncio.start_unix_server(self._serve, path)
+        else:
+            server = await asyncio.start_server(self._serve, host, port)
+        self._servers.append(server)
+        return server
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._pending:
+            self._flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._pool.shutdown)
+            self._pool = None
+
+    async def query(self, symbol, params=Params(), start=0, stop=None, outputs=SERIES):
+        """The Answer for `outputs` of `symbol` over bars start:stop."""
+        loop = asyncio.get_running_loop()
+        arrived = loop.time()
+        if symbol not in self.store:
+            raise ValueError('unknown symbol %r' % (symbol,))
+        unknown = [name for name in outputs if name not in SERIES]
+        if unknown:
+            raise ValueError('unknown outputs %s' % ', '.join(map(str, unknown)))
+        a, b = self.store.bounds(symbol)
+        start, stop, _ = slice(start, stop).indices(b - a)
+        stop = max(start, stop)
+        outputs = tuple(dict.fromkeys(outputs))
+
+        self.requests += 1
+        key = (symbol, params.digest(), start, stop, outputs)
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = loop.create_future()
+            self._pending.append((key, (symbol, params, start, stop, outputs)))
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        else:
+            self.coalesced += 1
+
+        # Shielded: one caller giving up must not cancel the others' computation
+        series, computing = await asyncio.shield(future)
+        queued = max(loop.time() - arrived - computing, 0.0)
+        if self.metrics is not None:
+            self.metrics.request(queued, computing)
+        return Answer(series, start, stop, queued, computing)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        # A symbol is evaluated in one piece, so the batch is split by symbol
+        # into up to `workers` tasks of about equal bars
+        bySymbol = {}
+        for key, job in batch:
+            bySymbol.setdefault(job[0], []).append((key, job))
+        tasks = [[] for _ in range(min(self.workers, len(bySymbol)))]
+        load = [0] * len(tasks)
+        for jobs in sorted(bySymbol.values(), key=_bars, reverse=True):
+            i = load.index(min(load))
+            tasks[i] += jobs
+            load[i] += _bars(jobs)
+        await asyncio.gather(*(self._submit(task) for task in tasks))
+
+    async def _submit(self, task):
+        keys = [key for key, _ in task]
+        try:
+            results, computing = await asyncio.get_running_loop().run_in_executor(
+                self._pool, _compute, [job for _, job in task])
+        except Exception as e:
+            for key in keys:
+                self._inflight.pop(key).set_exception(e)
+            return
+        for key, series in zip(keys, results):
+            self._inflight.pop(key).set_result((series, computing))
+
+    async def _serve(self, reader, writer):
+        answering = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._answer(line, writer))
+                answering.add(task)
+                task.add_done_callback(answering.discard)
+            await asyncio.gather(*answering)
+        except ConnectionError:
+            pass
+        finally:
+            for task in answering:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, line, writer):
+        id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request is a JSON object')
+            id = request.get('id')
+            inputs = request.get('inputs', {})
+            if not isinstance(inputs, dict):
+                raise ValueError('inputs are a JSON object')
+            answer = await self.query(request.get('symbol'), Params.from_dict(inputs),
+                                      request.get('start', 0), request.get('stop'),
+                                      request.get('outputs', SERIES))
+            head = {
+                'id': id, 'start': answer.start, 'stop': answer.stop,
+                'queueSeconds': answer.queued, 'computeSeconds': answer.computing,
+            }
+            line = await asyncio.get_running_loop().run_in_executor(self._pool, _encode, head, answer.series)
+        except (TypeError, ValueError) as e:
+            line = _error(id, str(e))
+        except Exception:
+            log.exception('request %r failed', id)
+            line = _error(id, 'internal error')
+        writer.write(line)
+        await writer.drain()
+
+
+def _bars(jobs):
+    # Bars one symbol's jobs evaluate, per Params
+    return max(job[3] for _, job in jobs) * len({job[1] for _, job in jobs})
+
+
+def _error(id, message):
+    return json.dumps({'id': id, 'error': message}).encode() + b'\n'
+
+
+def _encode(head, series):
+    # The response line: `head` and the series, na as null
+    return json.dumps(dict(head, series={name: _json(values) for name, values in series.items()})).encode() + b'\n'
+
+
+def _json(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+
+#---- Workers ---------------------------
+_worker = {}
+
+
+def _open_store(path, cache_bytes):
+    _worker['store'] = BarStore(path)
+    _worker['cache'] = ResultCache(cache_bytes)
+
+
+def _compute(jobs):
+    """[{name: ndarray}] for jobs of (symbol, params, start, stop, outputs), and
+    the seconds taken."""
+    began = time.perf_counter()
+    store, cache = _worker['store'], _worker['cache']
+    bySymbol = {}
+    for i, (symbol, _, _, _, _) in enumerate(jobs):
+        bySymbol.setdefault(symbol, []).append(i)
+
+    results = [None] * len(jobs)
+    for symbol, indices in bySymbol.items():
+        # The whole stored history, so every range of it is served by one entry
+        a, b = store.bounds(symbol)
+        bars = [store.bars[field][a:b] for field in ('open', 'high', 'low', 'close')]
+        outputs = tuple(dict.fromkeys(name for i in indices for name in jobs[i][4]))
+        for i in indices:
+            _, params, start, stop, names = jobs[i]
+            run = cache.get(symbol, *bars, params, outputs)
+            results[i] = {name: run[name][start:stop] for name in names}
+    return results, time.perf_counter() - began
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m demark.server', description=__doc__.splitlines()[0])
+    parser.add_argument('store', help='bar store directory (see demark.store)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--path', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--window', type=float, default=0.002, help='batching window in seconds')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--cache-bytes', type=int, default=256 * 2 ** 20, help='result cache size per worker')
+    args = parser.parse_args(argv)
+
+    async def serve():
+        async with QueryServer(args.store, args.workers, args.window, args.max_batch,
+                               cache_bytes=args.cache_bytes) as server:
+            listener = await server.listen(args.host, args.port, args.path)
+            await listener.serve_forever()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Arrays shared with worker processes without pickling their contents.
+
+share() turns an array into a picklable reference: an np.memmap over a whole
+file is referenced by its file name and offset, anything else is copied once
+into a new shared-memory block. allocate() creates a block for a worker to fill,
+view() opens a reference in any process. A pool initializer attach()es the
+arrays every task needs into `worker`, the per-process state its tasks read.
+
+The process that created a block closes and unlinks it once the workers are
+done; a process that only opened one just closes it.
+"""
+
+import mmap
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-process state of a worker: 'inputs' and 'outputs' ({name: ndarray}) and
+# whatever context attach() was given
+worker = {}
+
+
+def share(array):
+    """A picklable reference to `array` and the shared block created for it, if any."""
+    # Only a memmap over its whole mapping knows its own file offset
+    if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.dtype == np.float64:
+        return ('file', array.filename, array.offset, len(array), array.dtype.str), None
+    array = np.ascontiguousarray(array, dtype=np.float64)
+    ref, block, values = allocate(len(array), np.float64)
+    values[:] = array
+    return ref, block
+
+
+def allocate(n, dtype):
+    """A new shared block for `n` values of `dtype`: (reference, block, ndarray over it)."""
+    dtype = np.dtype(dtype)
+    block = shared_memory.SharedMemory(create=True, size=max(n * dtype.itemsize, 1))
+    return ('shm', block.name, 0, n, dtype.str), block, np.ndarray(n, dtype=dtype, buffer=block.buf)
+
+
+def view(ref):
+    """(ndarray, block) for a reference made by share() or allocate(); block is
+    None for a file, otherwise the caller closes it after dropping the array."""
+    kind, name, offset, length, dtype = ref
+    if kind == 'file':
+        return np.memmap(name, dtype=dtype, mode='r', offset=offset, shape=(length,)), None
+    block = shared_memory.SharedMemory(name=name)
+    return np.ndarray(length, dtype=dtype, buffer=block.buf, offset=offset), block
+
+
+def views(refs):
+    """({name: ndarray}, [blocks]) for a mapping of references."""
+    arrays, blocks = {}, []
+    for name, ref in refs.items():
+        arrays[name], block = view(ref)
+        if block is not None:
+            blocks.append(block)
+    return arrays, blocks
+
+
+def attach(inputs, outputs, context):
+    """Pool initializer: open the `inputs` and `outputs` references into
+    `worker`, along with the `context` mapping."""
+    worker['inputs'], inputBlocks = views(inputs)
+    worker['outputs'], outputBlocks = views(outputs)
+    worker['blocks'] = inputBlocks + outputBlocks
+    worker.update(context)
+
+
+def detach():
+    # Views must go before their blocks can be closed
+    blocks = worker.pop('blocks', [])
+    worker.clear()
+    for block in blocks:
+        block.close()
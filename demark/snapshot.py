@@ -0,0 +1,146 @@
+"""Binary snapshots of the carried state of TDStream and TDTable.
+
+A snapshot is an uncompressed .npz holding one array per state variable, plus
+a JSON header recording the format version, the engine, its Params and the
+number of symbols. Rings and deques are stored as their live contents only,
+oldest first, so a TDTable of 8,000 symbols takes a few megabytes and loads in
+milliseconds. An engine restored with load() produces the same output, bar for
+bar, as the engine that was saved.
+
+    save(table, 'state.npz')                  # atomic: readers never see a partial file
+    table = load('state.npz')
+
+    checkpoint = Checkpoint(table, 'state.npz', every=60)
+    for bar in bars:
+        table.update(*bar)
+        checkpoint()                          # saves at most once a minute
+"""
+
+import json
+import os
+import tempfile
+import time
+from collections import deque
+
+import numpy as np
+
+from .params import Params
+from .stream import TDStream
+from .table import TDTable
+from .window import RollingExtreme, Ring
+
+FORMAT = 'demark-snapshot'
+VERSION = 1
+
+# Attributes rebuilt by the engine constructor rather than stored
+_CONSTRUCTED = frozenset(('params', 'n', '_source', 'metrics', '_update', 'update'))
+
+
+def state(engine):
+    """{name: ndarray} of the carried state of a TDStream or TDTable."""
+    arrays = {}
+    for name, value in vars(engine).items():
+        if name in _CONSTRUCTED:
+            continue
+        if isinstance(value, Ring):
+            # Stored symbol-major, (N, size), whatever the ring's own layout
+            arrays[name] = value.last(value.size).T
+            arrays[name + '.count'] = np.asarray(value.count)
+        elif isinstance(value, RollingExtreme):
+            arrays[name] = np.array(value.queue, dtype=np.float64).reshape(-1, 2)
+            arrays[name + '.bar'] = np.asarray(value.bar)
+        elif isinstance(value, deque):
+            arrays[name] = np.array(value, dtype=np.float64)
+        else:
+            arrays[name] = np.asarray(value)
+    return arrays
+
+
+def restore(engine, arrays):
+    """Load the state() of an engine of the same kind and Params into `engine`."""
+    expected = set(state(engine))
+    if set(arrays) != expected:
+        raise ValueError('snapshot state does not match %s: missing %s, unexpected %s' % (
+            type(engine).__name__, sorted(expected - set(arrays)) or '-', sorted(set(arrays) - expected) or '-'))
+    for name, value in vars(engine).items():
+        if name in _CONSTRUCTED:
+            continue
+        stored = arrays[name]
+        if isinstance(value, Ring):
+            value.buf[:value.size] = stored.T
+            value.buf[value.size:] = stored.T
+            value.pos = value.size - 1
+            value.count = int(arrays[name + '.count'])
+        elif isinstance(value, RollingExtreme):
+            value.queue = deque((int(bar), extreme) for bar, extreme in stored.tolist())
+            value.bar = int(arrays[name + '.bar'])
+        elif isinstance(value, deque):
+            value.clear()
+            value.extend(stored.tolist())
+        elif isinstance(value, np.ndarray):
+            setattr(engine, name, stored.astype(value.dtype, copy=True))
+        else:
+            setattr(engine, name, stored.item())
+    return engine
+
+
+def save(engine, path):
+    """Atomically write a snapshot of `engine` to `path`."""
+    header = {
+        'format': FORMAT,
+        'version': VERSION,
+        'engine': type(engine).__name__,
+        'params': engine.params.as_dict(),
+        'n': getattr(engine, 'n', None),
+    }
+    arrays = state(engine)
+    arrays['header'] = np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.snapshot-', suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load(path, metrics=None):
+    """The engine saved at `path`, ready to take the next bar."""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    header = json.loads(arrays.pop('header').tobytes())
+    if header.get('format') != FORMAT:
+        raise ValueError('%s is not a snapshot' % (path,))
+    if header['version'] != VERSION:
+        raise ValueError('snapshot version %s is not supported (expected %d)' % (header['version'], VERSION))
+    params = Params(**header['params'])
+    if header['engine'] == 'TDTable':
+        engine = TDTable(header['n'], params, metrics)
+    elif header['engine'] == 'TDStream':
+        engine = TDStream(params, metrics)
+    else:
+        raise ValueError('unknown engine %r in snapshot' % (header['engine'],))
+    return restore(engine, arrays)
+
+
+class Checkpoint:
+    """Call after each update() to save `engine` to `path` every `every` seconds."""
+
+    def __init__(self, engine, path, every=60.0, clock=time.monotonic):
+        self.engine = engine
+        self.path = path
+        self.every = every
+        self.clock = clock
+        self.saved = clock()
+
+    def __call__(self, force=False):
+        now = self.clock()
+        if force or now - self.saved >= self.every:
+            save(self.engine, self.path)
+            self.saved = now
+            return True
+        return False
@@ -0,0 +1,207 @@
+"""Memory-mapped columnar bar store.
+
+A store is a directory holding one contiguous .npy array per field (open, high,
+low, close as float64, and time as int64 epoch seconds when the sources have
+it), plus symbols.json with the symbol names and offsets.npy with their
+boundaries: symbol i occupies bars offsets[i]:offsets[i+1], the layout scan()
+takes. BarStore opens the arrays as read-only memmaps, so the engines read them
+without copying:
+
+    build('bars/', {'AAPL': 'AAPL.csv', 'MSFT': 'MSFT.parquet'})
+    store = BarStore('bars/')
+    scan(store.bars, store.offsets)
+    compute(*store.ohlc('AAPL'))
+    store.source('hlc3', 'AAPL')
+
+PriceSource variants are computed on first use and cached in the store as
+source.<name>.npy. open/high/low/close are the field arrays themselves.
+
+CSV files need a header row naming open, high, low and close (any case) and
+optionally time/timestamp/date/datetime, either epoch seconds or ISO 8601;
+the store keeps times only if every source has them. Parquet files
+need pyarrow, imported only when one is loaded.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .batch import FIELDS
+from .params import PRICE_SOURCES
+
+TIME_COLUMNS = ('time', 'timestamp', 'date', 'datetime')
+
+# Bars per step when computing a PriceSource variant, bounding its memory
+_CHUNK = 1 << 22
+
+
+class BarStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'symbols.json')) as f:
+            self.symbols = json.load(f)
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.bars = {field: np.load(os.path.join(path, field + '.npy'), mmap_mode='r') for field in FIELDS}
+        timePath = os.path.join(path, 'time.npy')
+        self.time = np.load(timePath, mmap_mode='r') if os.path.exists(timePath) else None
+        self._position = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._sources = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._position
+
+    def bounds(self, symbol):
+        i = self._position[symbol]
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def ohlc(self, symbol):
+        """(open, high, low, close) views of one symbol."""
+        a, b = self.bounds(symbol)
+        return tuple(self.bars[field][a:b] for field in FIELDS)
+
+    def source(self, name, symbol=None):
+        """The PriceSource variant `name` over the store, or one symbol's view of it."""
+        values = self._sources.get(name)
+        if values is None:
+            values = self._sources[name] = self._source(name)
+        if symbol is None:
+            return values
+        a, b = self.bounds(symbol)
+        return values[a:b]
+
+    def _source(self, name):
+        if name in FIELDS:
+            return self.bars[name]
+        if name not in PRICE_SOURCES:
+            raise ValueError('unknown PriceSource %r' % (name,))
+        path = os.path.join(self.path, 'source.%s.npy' % name)
+        if not os.path.exists(path):
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.npy')
+            os.close(fd)
+            n = len(self.bars['close'])
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float64, shape=(n,))
+            for start in range(0, n, _CHUNK):
+                out[start:start + _CHUNK] = PRICE_SOURCES[name](
+                    *(self.bars[field][start:start + _CHUNK] for field in FIELDS))
+            out.flush()
+            del out
+            os.replace(tmp, path)
+        return np.load(path, mmap_mode='r')
+
+
+def build(path, sources, workers=None):
+    """Load `sources` ({symbol: CSV or Parquet path}, in store order) into a new
+    store at `path`, parsing files in parallel on `workers` processes. An
+    existing store at `path` is replaced once the new one is complete."""
+    sources = dict(sources)
+    parent = os.path.dirname(os.path.abspath(path))
+    work = tempfile.mkdtemp(dir=parent, prefix='.store-')
+    try:
+        # Each file is parsed into its own arrays, then copied into place
+        parts = [(file, os.path.join(work, 'part%d.npz' % i)) for i, file in enumerate(sources.values())]
+        if workers == 1 or len(parts) < 2:
+            parsed = [_parse(file, part) for file, part in parts]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                parsed = list(pool.map(_parse, *zip(*parts)))
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([length for length, _ in parsed], out=offsets[1:])
+        n = int(offsets[-1])
+
+        # Times are kept only if every source has them
+        timed = bool(parsed) and all(hasTime for _, hasTime in parsed)
+        columns = FIELDS + (('time',) if timed else ())
+        out = {name: np.lib.format.open_memmap(os.path.join(work, name + '.npy'), mode='w+',
+                                               dtype=np.int64 if name == 'time' else np.float64, shape=(n,))
+               for name in columns}
+        for (_, part), a, b in zip(parts, offsets[:-1], offsets[1:]):
+            with np.load(part) as data:
+                for name in columns:
+                    out[name][a:b] = data[name]
+            os.unlink(part)
+        for array in out.values():
+            array.flush()
+        del out
+
+        np.save(os.path.join(work, 'offsets.npy'), offsets)
+        with open(os.path.join(work, 'symbols.json'), 'w') as f:
+            json.dump(list(sources), f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(work, path)
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    return BarStore(path)
+
+
+def read(file):
+    """{field: ndarray} of one CSV or Parquet file."""
+    if file.endswith(('.parquet', '.pq')):
+        return _read_parquet(file)
+    return _read_csv(file)
+
+
+def _parse(file, part):
+    columns = read(file)
+    np.savez(part, **columns)
+    return len(columns['close']), 'time' in columns
+
+
+def _read_csv(file):
+    with open(file) as f:
+        header = [name.strip().lower() for name in f.readline().split(',')]
+    position = _columns(file, header)
+    # One pass over the file: as text when times (maybe ISO 8601) come along
+    timed = 'time' in position
+    data = np.loadtxt(file, delimiter=',', skiprows=1, ndmin=2, dtype=str if timed else np.float64,
+                      usecols=[position[field] for field in FIELDS] + ([position['time']] if timed else []))
+    columns = {field: data[:, i].astype(np.float64) for i, field in enumerate(FIELDS)}
+    if timed:
+        columns['time'] = _epoch(data[:, len(FIELDS)])
+    return columns
+
+
+def _read_parquet(file):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('reading %s requires pyarrow' % (file,)) from None
+    table = pq.read_table(file)
+    header = [name.lower() for name in table.column_names]
+    position = _columns(file, header)
+    columns = {field: table.column(position[field]).to_numpy().astype(np.float64) for field in FIELDS}
+    if 'time' in position:
+        columns['time'] = _epoch(table.column(position['time']).to_numpy())
+    return columns
+
+
+def _columns(file, header):
+    position = {}
+    for field in FIELDS:
+        if field not in header:
+            raise ValueError('%s has no %s column' % (file, field))
+        position[field] = header.index(field)
+    for name in TIME_COLUMNS:
+        if name in header:
+            position['time'] = header.index(name)
+            break
+    return position
+
+
+def _epoch(values):
+    # Epoch seconds given as numbers, ISO 8601 strings or datetime64
+    values = np.asarray(values)
+    if values.dtype.kind in 'Mm':
+        return values.astype('datetime64[s]').astype(np.int64)
+    try:
+        return values.astype(np.float64).astype(np.int64)
+    except ValueError:
+        return values.astype('datetime64[s]').astype(np.int64)
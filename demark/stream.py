@@ -0,0 +1,397 @@
+"""Streaming engine: one bar in, that bar's outputs out, in constant time.
+
+TDStream holds exactly the state the script carries through its [1] references,
+the last values of the valuewhen() conditions it needs, and ring buffers sized to
+SetupLookback, CntdwnLookback and the TDST/risk windows. The bar outputs match
+batch.compute() bar for bar.
+"""
+
+import math
+import time
+from collections import deque
+from itertools import islice
+
+from .batch import cntdwnIsDeferred, cntdwnIsQualified, setupIsDeferred, setupIsPerfected
+from .params import PRICE_SOURCES, Params
+from .window import RollingExtreme
+
+na = float('nan')
+isna = math.isnan
+
+
+def nz(x, replacement=0.0):
+    return replacement if isna(x) else x
+
+
+def truthy(x):
+    return not isna(x) and x != 0
+
+
+class TDStream:
+    """Bar-by-bar TD Sequential state for one symbol."""
+
+    def __init__(self, params=Params(), metrics=None):
+        p = self.params = params
+        self._source = PRICE_SOURCES[p.PriceSource]
+        self.bar = -1
+        self.prevClose = na
+
+        # Lookback ring buffers, the oldest entry is series[Lookback]
+        self.srcRing = deque(maxlen=p.SetupLookback + 1)
+        self.highRing = deque(maxlen=p.CntdwnLookback + 1)
+        self.lowRing = deque(maxlen=p.CntdwnLookback + 1)
+        # TDST ladder windows, only needed when extended
+        trendWindow = 10 * p.SetupBars if p.SetupTrendExtend and not p.SetupTrendExact else 0
+        self.trendLowRing = deque(maxlen=trendWindow)
+        self.trendHighRing = deque(maxlen=trendWindow)
+        # Exact extended TDST: low/high since the previous same-direction setup
+        self.trendLowSinceSell = self.trendHighSinceBuy = na
+
+        # highest()/lowest() windows of TDST and riskLevel, with the tr of the last
+        # bar that was its own window extreme: valuewhen(high==highest(n), tr, 0)
+        self.highestSetup = RollingExtreme(p.SetupBars, maximum=True)
+        self.lowestSetup = RollingExtreme(p.SetupBars, maximum=False)
+        self.highestCntdwn = RollingExtreme(p.CntdwnBars, maximum=True)
+        self.lowestCntdwn = RollingExtreme(p.CntdwnBars, maximum=False)
+        self.highestSetupTr = self.lowestSetupTr = na
+        self.highestCntdwnTr = self.lowestCntdwnTr = na
+
+        # TD Setups
+        self.setupCountUp = self.setupCountDown = 0
+        self.setupSellBar = self.setupBuyBar = -1
+        # valuewhen(setupCountUp==(SetupBars-SetupPerfLookback[+1]), high, 0) and
+        # valuewhen(setupCountUp==(SetupBars-1), high, 0); lows for the buy side
+        self.sellPerfHigh0 = self.sellPerfHigh1 = self.sellLastHigh = na
+        self.buyPerfLow0 = self.buyPerfLow1 = self.buyLastLow = na
+        self.setupSellPerfPrice = self.setupBuyPerfPrice = na
+        self.setupSellPerfMask = self.setupBuyPerfMask = na
+        self.setupTrendSupport = self.setupTrendResist = na
+
+        # TD Countdown
+        self.cntdwnCountUp = self.cntdwnCountDown = na
+        self.cntdwnSellQualPrice = self.cntdwnBuyQualPrice = na
+        self.cntdwnSellQualMask = self.cntdwnBuyQualMask = na
+
+        # TD Risk Level
+        self.riskLevel = na
+
+        # With a metrics.Metrics, update() is the timed wrapper; without one the
+        # plain method is left in place and instrumentation costs nothing
+        self.metrics = metrics
+        if metrics is not None:
+            self._update = self.update
+            self.update = self._timed_update
+
+    def update(self, open, high, low, close):
+        """Advance by one closed bar and return its series values by Pine name."""
+        p = self.params
+        self.bar += 1
+        src = self._source(open, high, low, close)
+        prevClose = self.prevClose
+        tr = na if isna(prevClose) else max(high - low, abs(high - prevClose), abs(low - prevClose))
+        self.prevClose = close
+
+        #---- TD Price Flips
+        self.srcRing.append(src)
+        prior = self.srcRing[0] if len(self.srcRing) > p.SetupLookback else na
+        setupPriceUp = src > prior
+        setupPriceDown = src < prior
+        setupPriceEqual = src == prior
+
+        #---- TD Setups
+        if p.SetupEqualEnable:
+            countUp = self.setupCountUp + 1 if setupPriceUp or (self.setupCountUp and setupPriceEqual) else 0
+            countDown = self.setupCountDown + 1 if setupPriceDown or (self.setupCountDown and setupPriceEqual) else 0
+        else:
+            countUp = self.setupCountUp + 1 if setupPriceUp else 0
+            countDown = self.setupCountDown + 1 if setupPriceDown else 0
+        self.setupCountUp, self.setupCountDown = countUp, countDown
+
+        setupSell = src if countUp == p.SetupBars else na
+        setupBuy = src if countDown == p.SetupBars else na
+        if truthy(setupSell):
+            prevSellCount = self.bar - 1 - self.setupSellBar if self.setupSellBar >= 0 else na
+            self.setupSellBar = self.bar
+        if truthy(setupBuy):
+            prevBuyCount = self.bar - 1 - self.setupBuyBar if self.setupBuyBar >= 0 else na
+            self.setupBuyBar = self.bar
+        setupSellCount = self.bar - self.setupSellBar if self.setupSellBar >= 0 else na
+        setupBuyCount = self.bar - self.setupBuyBar if self.setupBuyBar >= 0 else na
+
+        # Perfected Setups
+        first = p.SetupBars - p.SetupPerfLookback
+        if countUp == first:
+            self.sellPerfHigh0 = high
+        if countUp == first + 1:
+            self.sellPerfHigh1 = high
+        if countDown == first:
+            self.buyPerfLow0 = low
+        if countDown == first + 1:
+            self.buyPerfLow1 = low
+        if countUp == p.SetupBars - 1:
+            self.sellLastHigh = high
+        if countDown == p.SetupBars - 1:
+            self.buyLastLow = low
+
+        if countUp == p.SetupBars:
+            a, b = self.sellPerfHigh0, self.sellPerfHigh1
+            sellPerfPrice = a if a >= b else b
+        else:
+            sellPerfPrice = nz(self.setupSellPerfPrice)
+        prevMask = self.setupSellPerfMask
+        if nz(prevMask) >= setupIsPerfected or not isna(setupBuy):
+            sellMask = na
+        elif countUp == p.SetupBars:
+            sellMask = (setupIsPerfected if self.sellLastHigh >= sellPerfPrice or high >= sellPerfPrice
+                        else setupIsDeferred)
+        elif isna(prevMask):
+            sellMask = na
+        else:
+            sellMask = setupIsPerfected if high >= sellPerfPrice else prevMask
+        self.setupSellPerfPrice, self.setupSellPerfMask = sellPerfPrice, sellMask
+
+        if countDown == p.SetupBars:
+            a, b = self.buyPerfLow0, self.buyPerfLow1
+            buyPerfPrice = a if a <= b else b
+        else:
+            buyPerfPrice = nz(self.setupBuyPerfPrice)
+        prevMask = self.setupBuyPerfMask
+        if nz(prevMask) >= setupIsPerfected or not isna(setupSell):
+            buyMask = na
+        elif countDown == p.SetupBars:
+            buyMask = (setupIsPerfected if self.buyLastLow <= buyPerfPrice or low <= buyPerfPrice
+                       else setupIsDeferred)
+        elif isna(prevMask):
+            buyMask = na
+        else:
+            buyMask = setupIsPerfected if low <= buyPerfPrice else prevMask
+        self.setupBuyPerfPrice, self.setupBuyPerfMask = buyPerfPrice, buyMask
+
+        #---- TD Setup Trend (TDST)
+        highestSetup = self.highestSetup.push(high)
+        lowestSetup = self.lowestSetup.push(low)
+        exact = p.SetupTrendExtend and p.SetupTrendExact
+        if exact:
+            self.trendLowSinceSell = low if isna(self.trendLowSinceSell) else min(self.trendLowSinceSell, low)
+            self.trendHighSinceBuy = high if isna(self.trendHighSinceBuy) else max(self.trendHighSinceBuy, high)
+        elif p.SetupTrendExtend:
+            self.trendLowRing.append(low)
+            self.trendHighRing.append(high)
+        if truthy(setupSell):
+            if exact:
+                # The setup bar closes this window and opens the next one
+                support = self.trendLowSinceSell
+                self.trendLowSinceSell = low
+            elif p.SetupTrendExtend:
+                support = self._ladder(self.trendLowRing, prevSellCount, min)
+            else:
+                support = lowestSetup
+        else:
+            support = nz(self.setupTrendSupport)
+        if truthy(setupBuy):
+            if exact:
+                resist = self.trendHighSinceBuy
+                self.trendHighSinceBuy = high
+            elif p.SetupTrendExtend:
+                resist = self._ladder(self.trendHighRing, prevBuyCount, max)
+            else:
+                resist = highestSetup
+        else:
+            resist = nz(self.setupTrendResist)
+        self.setupTrendSupport, self.setupTrendResist = support, resist
+
+        #---- TD Countdown
+        self.highRing.append(high)
+        self.lowRing.append(low)
+        highPrior = self.highRing[0] if len(self.highRing) > p.CntdwnLookback else na
+        lowPrior = self.lowRing[0] if len(self.lowRing) > p.CntdwnLookback else na
+        up = high if p.CntdwnAggressive else src
+        down = low if p.CntdwnAggressive else src
+        cntdwnPriceUp = na if isna(up) or isna(highPrior) else float(up >= highPrior)
+        cntdwnPriceDown = na if isna(down) or isna(lowPrior) else float(down <= lowPrior)
+
+        recycleUp = src if countUp == 2 * p.SetupBars else na
+        recycleDown = src if countDown == 2 * p.SetupBars else na
+
+        prev = self.cntdwnCountUp
+        if isna(cntdwnPriceUp):
+            cntUp = prev
+        elif not isna(setupBuy) or src < support or not isna(recycleUp):
+            cntUp = na
+        elif not isna(setupSell):
+            cntUp = cntdwnPriceUp
+        elif isna(prev):
+            cntUp = na
+        else:
+            cntUp = prev + cntdwnPriceUp
+        cntUpImp = cntUp if truthy(cntdwnPriceUp) else na
+
+        prev = self.cntdwnCountDown
+        if isna(cntdwnPriceDown):
+            cntDown = prev
+        elif not isna(setupSell) or src > resist or not isna(recycleDown):
+            cntDown = na
+        elif not isna(setupBuy):
+            cntDown = cntdwnPriceDown
+        elif isna(prev):
+            cntDown = na
+        else:
+            cntDown = prev + cntdwnPriceDown
+        cntDownImp = cntDown if truthy(cntdwnPriceDown) else na
+        self.cntdwnCountUp, self.cntdwnCountDown = cntUp, cntDown
+
+        # Qualification of Countdowns
+        if p.CntdwnQualBar < p.CntdwnBars:
+            sellQualPrice = src if cntUpImp == p.CntdwnQualBar else nz(self.cntdwnSellQualPrice)
+            prevMask = self.cntdwnSellQualMask
+            if nz(prevMask) >= cntdwnIsQualified or isna(cntUp):
+                sellQualMask = na
+            elif cntUpImp == p.CntdwnBars:
+                sellQualMask = cntdwnIsQualified if high >= sellQualPrice else cntdwnIsDeferred
+            elif isna(prevMask):
+                sellQualMask = na
+            elif cntUpImp > p.CntdwnBars:
+                sellQualMask = cntdwnIsQualified if high >= sellQualPrice else prevMask
+            else:
+                sellQualMask = prevMask
+
+            buyQualPrice = src if cntDownImp == p.CntdwnQualBar else nz(self.cntdwnBuyQualPrice)
+            prevMask = self.cntdwnBuyQualMask
+            if nz(prevMask) >= cntdwnIsQualified or isna(cntDown):
+                buyQualMask = na
+            elif cntDownImp == p.CntdwnBars:
+                buyQualMask = cntdwnIsQualified if low <= buyQualPrice else cntdwnIsDeferred
+            elif isna(prevMask):
+                buyQualMask = na
+            elif cntDownImp > p.CntdwnBars:
+                buyQualMask = cntdwnIsQualified if low <= buyQualPrice else prevMask
+            else:
+                buyQualMask = prevMask
+        else:
+            sellQualPrice = buyQualPrice = na
+            sellQualMask = cntdwnIsQualified if cntUp == p.CntdwnBars else na
+            buyQualMask = cntdwnIsQualified if cntDown == p.CntdwnBars else na
+        self.cntdwnSellQualPrice, self.cntdwnSellQualMask = sellQualPrice, sellQualMask
+        self.cntdwnBuyQualPrice, self.cntdwnBuyQualMask = buyQualPrice, buyQualMask
+
+        sellQualMaskImp = sellQualMask if truthy(cntUpImp) else na
+        buyQualMaskImp = buyQualMask if truthy(cntDownImp) else na
+        cntdwnSell = src if sellQualMaskImp == cntdwnIsQualified else na
+        cntdwnSellDefer = src if sellQualMaskImp == cntdwnIsDeferred else na
+        cntdwnBuy = src if buyQualMaskImp == cntdwnIsQualified else na
+        cntdwnBuyDefer = src if buyQualMaskImp == cntdwnIsDeferred else na
+
+        #---- TD Risk Level
+        # valuewhen(high == highest(n), tr, 0): the tr of the last bar that was
+        # its own window extreme, which need not be the bar of the current
+        # extreme, see pine.rolling_extreme()
+        if high == highestSetup:
+            self.highestSetupTr = tr
+        if low == lowestSetup:
+            self.lowestSetupTr = tr
+        highestCntdwn = self.highestCntdwn.push(high)
+        lowestCntdwn = self.lowestCntdwn.push(low)
+        if high == highestCntdwn:
+            self.highestCntdwnTr = tr
+        if low == lowestCntdwn:
+            self.lowestCntdwnTr = tr
+
+        if truthy(setupSell) or truthy(recycleUp):
+            riskLevel = highestSetup + self.highestSetupTr
+        elif truthy(setupBuy) or truthy(recycleDown):
+            riskLevel = lowestSetup - self.lowestSetupTr
+        elif truthy(cntdwnSell):
+            riskLevel = highestCntdwn + self.highestCntdwnTr
+        elif truthy(cntdwnBuy):
+            riskLevel = lowestCntdwn - self.lowestCntdwnTr
+        else:
+            riskLevel = nz(self.riskLevel, low)
+        self.riskLevel = riskLevel
+
+        return {
+            'PriceSource': src,
+            'setupPriceUp': setupPriceUp,
+            'setupPriceDown': setupPriceDown,
+            'setupPriceEqual': setupPriceEqual,
+            'setupCountUp': countUp,
+            'setupCountDown': countDown,
+            'setupSell': setupSell,
+            'setupBuy': setupBuy,
+            'setupSellCount': setupSellCount,
+            'setupBuyCount': setupBuyCount,
+            'setupSellPerfPrice': sellPerfPrice,
+            'setupSellPerfMask': sellMask,
+            'setupSellPerf': src if sellMask == setupIsPerfected else na,
+            'setupBuyPerfPrice': buyPerfPrice,
+            'setupBuyPerfMask': buyMask,
+            'setupBuyPerf': src if buyMask == setupIsPerfected else na,
+            'setupTrendSupport': support,
+            'setupTrendResist': resist,
+            'cntdwnPriceUp': cntdwnPriceUp,
+            'cntdwnPriceDown': cntdwnPriceDown,
+            'cntdwnCountUpRecycle': recycleUp,
+            'cntdwnCountDownRecycle': recycleDown,
+            'cntdwnCountUp': cntUp,
+            'cntdwnCountUpImp': cntUpImp,
+            'cntdwnCountDown': cntDown,
+            'cntdwnCountDownImp': cntDownImp,
+            'cntdwnSellQualPrice': sellQualPrice,
+            'cntdwnSellQualMask': sellQualMask,
+            'cntdwnSellQualMaskImp': sellQualMaskImp,
+            'cntdwnBuyQualPrice': buyQualPrice,
+            'cntdwnBuyQualMask': buyQualMask,
+            'cntdwnBuyQualMaskImp': buyQualMaskImp,
+            'cntdwnSell': cntdwnSell,
+            'cntdwnSellDefer': cntdwnSellDefer,
+            'cntdwnBuy': cntdwnBuy,
+            'cntdwnBuyDefer': cntdwnBuyDefer,
+            'riskLevel': riskLevel,
+        }
+
+    def preview(self, open, high, low, close):
+        """The outputs update() would return if the open bar closed now.
+
+        For intrabar ticks: the committed state is left as it was, so the next
+        tick, or update() when the bar closes, continues from the last closed bar.
+        Rolling back restores the attribute references and undoes the one append
+        per ring. The window extremes are only peeked.
+        """
+        committed = self.__dict__.copy()
+        rings = [(ring, ring[0] if len(ring) == ring.maxlen else None)
+                 for ring in (self.srcRing, self.highRing, self.lowRing, self.trendLowRing, self.trendHighRing)
+                 if ring.maxlen]
+        for name in ('highestSetup', 'lowestSetup', 'highestCntdwn', 'lowestCntdwn'):
+            setattr(self, name, _Peek(committed[name]))
+        out = TDStream.update(self, open, high, low, close)
+        self.__dict__.update(committed)
+        for ring, evicted in rings:
+            ring.pop()
+            if evicted is not None:
+                ring.appendleft(evicted)
+        return out
+
+    def _timed_update(self, open, high, low, close):
+        start = time.perf_counter()
+        out = self._update(open, high, low, close)
+        self.metrics.stream(time.perf_counter() - start, out)
+        return out
+
+    def _ladder(self, ring, prevCount, extreme):
+        # The script's extended TDST: the smallest k*SetupBars (k <= 10) covering
+        # setupCount[1], na while fewer bars than that are available
+        step = self.params.SetupBars
+        length = 10 * step
+        if not isna(prevCount):
+            length = min(max(math.ceil(prevCount / step), 1), 10) * step
+        if len(ring) < length:
+            return na
+        return extreme(islice(reversed(ring), length))
+
+
+class _Peek:
+    """A RollingExtreme for preview(): push() answers without pushing."""
+
+    __slots__ = ('push',)
+
+    def __init__(self, window):
+        self.push = window.after
@@ -0,0 +1,72 @@
+"""Parameter sweeps over the input() grid, sharing intermediates between combinations.
+
+Each pipeline section (batch.SECTIONS) depends on a subset of the inputs, so a
+section result is cached under the values of exactly those inputs. Sweeping
+SetupBars then reuses setupPriceUp/Down for every SetupBars value, sweeping
+CntdwnBars reuses cntdwnPriceUp/Down, and so on. Combinations are evaluated in
+an order that keeps combinations sharing upstream inputs next to each other.
+"""
+
+from collections import OrderedDict
+from dataclasses import replace
+from itertools import product
+
+import numpy as np
+
+from .batch import ALERTS, SECTIONS, namespace, pipeline, section_inputs
+from .params import Params
+
+
+def sweep_order():
+    """Input names ordered by the first section that reads them."""
+    order = []
+    for section in SECTIONS:
+        order += [name for name in section.inputs if name not in order]
+    return order
+
+
+def grid(base=Params(), **axes):
+    """Params for every combination of the given input values, e.g.
+    grid(SetupBars=range(7, 14), CntdwnBars=(11, 13, 15))."""
+    names = list(axes)
+    return [replace(base, **dict(zip(names, values))) for values in product(*axes.values())]
+
+
+def sweep(open, high, low, close, combinations, outputs=tuple(name for name, _ in ALERTS), max_bytes=256 * 2 ** 20):
+    """Evaluate the study for every Params in `combinations`.
+
+    Yields (params, {name: ndarray}) for the requested `outputs`, in sweep order
+    rather than input order. Arrays may be shared between combinations and must
+    be treated as read-only. `max_bytes` bounds the memory of cached section
+    results: beyond it the least recently used are dropped, and recomputed if a
+    later combination needs them again.
+    """
+    order = sweep_order()
+    inputs = section_inputs()
+    sections = [section.run for section in pipeline(outputs)]
+    # (section, values of its inputs): the series it wrote, across all sections
+    cache = OrderedDict()
+    nbytes = 0
+    bars = namespace(open, high, low, close)
+
+    for params in sorted(set(combinations), key=lambda p: tuple(getattr(p, name) for name in order)):
+        s = namespace(bars['open'], bars['high'], bars['low'], bars['close'])
+        for section in sections:
+            key = (section, tuple(getattr(params, name) for name in inputs[section]))
+            written = cache.get(key)
+            if written is None:
+                before = set(s)
+                section(s, params)
+                written = cache[key] = {name: s[name] for name in s.keys() - before}
+                nbytes += _nbytes(written)
+                while nbytes > max_bytes and len(cache) > 1:
+                    _, evicted = cache.popitem(last=False)
+                    nbytes -= _nbytes(evicted)
+            else:
+                cache.move_to_end(key)
+                s.update(written)
+        yield params, {name: s[name] for name in outputs}
+
+
+def _nbytes(written):
+    return sum(np.asarray(values).nbytes for values in written.values())
@@ -0,0 +1,315 @@
+"""Cross-sectional engine: the carried state of N symbols as a struct of arrays.
+
+TDTable is TDStream with every state variable widened to an array over symbols,
+so one update() advances the whole universe with NumPy operations. All symbols
+advance together: each update() takes one bar for every symbol. The bar outputs
+match TDStream (and batch.compute()) symbol for symbol.
+"""
+
+import time
+
+import numpy as np
+
+from .batch import cntdwnIsDeferred, cntdwnIsQualified, setupIsDeferred, setupIsPerfected
+from .params import PRICE_SOURCES, Params
+from .window import Ring
+
+na = np.nan
+
+
+def nz(x, replacement=0.0):
+    return np.where(np.isnan(x), replacement, x)
+
+
+def truthy(x):
+    return ~np.isnan(x) & (x != 0)
+
+
+class TDTable:
+    """Bar-by-bar TD Sequential state for `n` symbols, one column per state variable."""
+
+    def __init__(self, n, params=Params(), metrics=None):
+        p = self.params = params
+        self.n = n
+        self._source = PRICE_SOURCES[p.PriceSource]
+        self.bar = -1
+
+        def column(value=na):
+            return np.full(n, value)
+
+        self.prevClose = column()
+
+        # Lookback rings, and the window of TDST/riskLevel highest()/lowest()
+        self.srcRing = Ring(n, p.SetupLookback + 1)
+        self.highRing = Ring(n, p.CntdwnLookback + 1)
+        self.lowRing = Ring(n, p.CntdwnLookback + 1)
+        ladder = p.SetupTrendExtend and not p.SetupTrendExact
+        window = max(p.SetupBars, p.CntdwnBars, 10 * p.SetupBars if ladder else 0)
+        self.highWindow = Ring(n, window)
+        self.lowWindow = Ring(n, window)
+        # tr of the last bar that was its own window extreme
+        self.highestSetupTr, self.lowestSetupTr = column(), column()
+        self.highestCntdwnTr, self.lowestCntdwnTr = column(), column()
+        # Exact extended TDST: low/high since the previous same-direction setup
+        self.trendLowSinceSell, self.trendHighSinceBuy = column(), column()
+
+        # TD Setups
+        self.setupCountUp = np.zeros(n, dtype=np.int64)
+        self.setupCountDown = np.zeros(n, dtype=np.int64)
+        self.setupSellBar = np.full(n, -1, dtype=np.int64)
+        self.setupBuyBar = np.full(n, -1, dtype=np.int64)
+        self.sellPerfHigh0, self.sellPerfHigh1, self.sellLastHigh = column(), column(), column()
+        self.buyPerfLow0, self.buyPerfLow1, self.buyLastLow = column(), column(), column()
+        self.setupSellPerfPrice, self.setupBuyPerfPrice = column(), column()
+        self.setupSellPerfMask, self.setupBuyPerfMask = column(), column()
+        self.setupTrendSupport, self.setupTrendResist = column(), column()
+
+        # TD Countdown
+        self.cntdwnCountUp, self.cntdwnCountDown = column(), column()
+        self.cntdwnSellQualPrice, self.cntdwnBuyQualPrice = column(), column()
+        self.cntdwnSellQualMask, self.cntdwnBuyQualMask = column(), column()
+
+        # TD Risk Level
+        self.riskLevel = column()
+
+        # Instrumented as in TDStream
+        self.metrics = metrics
+        if metrics is not None:
+            self._update = self.update
+            self.update = self._timed_update
+
+    def update(self, open, high, low, close):
+        """Advance every symbol by one closed bar. Returns {series name: array over symbols}."""
+        p = self.params
+        open, high, low, close = (np.asarray(x, dtype=np.float64) for x in (open, high, low, close))
+        self.bar += 1
+        src = self._source(open, high, low, close)
+        prevClose = self.prevClose
+        tr = np.maximum(high - low, np.maximum(np.abs(high - prevClose), np.abs(low - prevClose)))
+        self.prevClose = close
+
+        #---- TD Price Flips
+        self.srcRing.push(src)
+        prior = self.srcRing.ago(p.SetupLookback)
+        setupPriceUp = src > prior
+        setupPriceDown = src < prior
+        setupPriceEqual = src == prior
+
+        #---- TD Setups
+        if p.SetupEqualEnable:
+            continueUp = setupPriceUp | ((self.setupCountUp != 0) & setupPriceEqual)
+            continueDown = setupPriceDown | ((self.setupCountDown != 0) & setupPriceEqual)
+        else:
+            continueUp, continueDown = setupPriceUp, setupPriceDown
+        countUp = np.where(continueUp, self.setupCountUp + 1, 0)
+        countDown = np.where(continueDown, self.setupCountDown + 1, 0)
+        self.setupCountUp, self.setupCountDown = countUp, countDown
+
+        setupSell = np.where(countUp == p.SetupBars, src, na)
+        setupBuy = np.where(countDown == p.SetupBars, src, na)
+        sellEvent, buyEvent = truthy(setupSell), truthy(setupBuy)
+        prevSellCount = np.where(self.setupSellBar >= 0, self.bar - 1 - self.setupSellBar, na)
+        prevBuyCount = np.where(self.setupBuyBar >= 0, self.bar - 1 - self.setupBuyBar, na)
+        self.setupSellBar = np.where(sellEvent, self.bar, self.setupSellBar)
+        self.setupBuyBar = np.where(buyEvent, self.bar, self.setupBuyBar)
+        setupSellCount = np.where(self.setupSellBar >= 0, self.bar - self.setupSellBar, na)
+        setupBuyCount = np.where(self.setupBuyBar >= 0, self.bar - self.setupBuyBar, na)
+
+        # Perfected Setups
+        first = p.SetupBars - p.SetupPerfLookback
+        self.sellPerfHigh0 = np.where(countUp == first, high, self.sellPerfHigh0)
+        self.sellPerfHigh1 = np.where(countUp == first + 1, high, self.sellPerfHigh1)
+        self.buyPerfLow0 = np.where(countDown == first, low, self.buyPerfLow0)
+        self.buyPerfLow1 = np.where(countDown == first + 1, low, self.buyPerfLow1)
+        self.sellLastHigh = np.where(countUp == p.SetupBars - 1, high, self.sellLastHigh)
+        self.buyLastLow = np.where(countDown == p.SetupBars - 1, low, self.buyLastLow)
+
+        sellStart = countUp == p.SetupBars
+        a, b = self.sellPerfHigh0, self.sellPerfHigh1
+        sellPerfPrice = np.where(sellStart, np.where(a >= b, a, b), nz(self.setupSellPerfPrice))
+        sellMask = _latch(self.setupSellPerfMask, sellStart, ~np.isnan(setupBuy),
+                          np.where(sellStart, (self.sellLastHigh >= sellPerfPrice) | (high >= sellPerfPrice),
+                                   high >= sellPerfPrice),
+                          setupIsPerfected, setupIsDeferred)
+        self.setupSellPerfPrice, self.setupSellPerfMask = sellPerfPrice, sellMask
+
+        buyStart = countDown == p.SetupBars
+        a, b = self.buyPerfLow0, self.buyPerfLow1
+        buyPerfPrice = np.where(buyStart, np.where(a <= b, a, b), nz(self.setupBuyPerfPrice))
+        buyMask = _latch(self.setupBuyPerfMask, buyStart, ~np.isnan(setupSell),
+                         np.where(buyStart, (self.buyLastLow <= buyPerfPrice) | (low <= buyPerfPrice),
+                                  low <= buyPerfPrice),
+                         setupIsPerfected, setupIsDeferred)
+        self.setupBuyPerfPrice, self.setupBuyPerfMask = buyPerfPrice, buyMask
+
+        #---- TD Setup Trend (TDST)
+        self.highWindow.push(high)
+        self.lowWindow.push(low)
+        highestSetup, lowestSetup = self.highWindow.highest(p.SetupBars), self.lowWindow.lowest(p.SetupBars)
+        if p.SetupTrendExtend and p.SetupTrendExact:
+            self.trendLowSinceSell = np.fmin(self.trendLowSinceSell, low)
+            self.trendHighSinceBuy = np.fmax(self.trendHighSinceBuy, high)
+            sellLevel, buyLevel = self.trendLowSinceSell, self.trendHighSinceBuy
+            # The setup bar closes this window and opens the next one
+            self.trendLowSinceSell = np.where(sellEvent, low, self.trendLowSinceSell)
+            self.trendHighSinceBuy = np.where(buyEvent, high, self.trendHighSinceBuy)
+        elif p.SetupTrendExtend:
+            sellLevel = self._ladder(self.lowWindow, prevSellCount, sellEvent, np.min)
+            buyLevel = self._ladder(self.highWindow, prevBuyCount, buyEvent, np.max)
+        else:
+            sellLevel, buyLevel = lowestSetup, highestSetup
+        support = np.where(sellEvent, sellLevel, nz(self.setupTrendSupport))
+        resist = np.where(buyEvent, buyLevel, nz(self.setupTrendResist))
+        self.setupTrendSupport, self.setupTrendResist = support, resist
+
+        #---- TD Countdown
+        self.highRing.push(high)
+        self.lowRing.push(low)
+        highPrior, lowPrior = self.highRing.ago(p.CntdwnLookback), self.lowRing.ago(p.CntdwnLookback)
+        up = high if p.CntdwnAggressive else src
+        down = low if p.CntdwnAggressive else src
+        cntdwnPriceUp = np.where(np.isnan(up) | np.isnan(highPrior), na, up >= highPrior)
+        cntdwnPriceDown = np.where(np.isnan(down) | np.isnan(lowPrior), na, down <= lowPrior)
+
+        recycleUp = np.where(countUp == 2 * p.SetupBars, src, na)
+        recycleDown = np.where(countDown == 2 * p.SetupBars, src, na)
+
+        cntUp = _count(self.cntdwnCountUp, cntdwnPriceUp, setupSell,
+                       ~np.isnan(setupBuy) | (src < support) | ~np.isnan(recycleUp))
+        cntDown = _count(self.cntdwnCountDown, cntdwnPriceDown, setupBuy,
+                         ~np.isnan(setupSell) | (src > resist) | ~np.isnan(recycleDown))
+        cntUpImp = np.where(truthy(cntdwnPriceUp), cntUp, na)
+        cntDownImp = np.where(truthy(cntdwnPriceDown), cntDown, na)
+        self.cntdwnCountUp, self.cntdwnCountDown = cntUp, cntDown
+
+        # Qualification of Countdowns
+        if p.CntdwnQualBar < p.CntdwnBars:
+            sellQualPrice = np.where(cntUpImp == p.CntdwnQualBar, src, nz(self.cntdwnSellQualPrice))
+            sellStart = cntUpImp == p.CntdwnBars
+            sellQualMask = _latch(self.cntdwnSellQualMask, sellStart, np.isnan(cntUp),
+                                  (sellStart | (cntUpImp > p.CntdwnBars)) & (high >= sellQualPrice),
+                                  cntdwnIsQualified, cntdwnIsDeferred)
+            buyQualPrice = np.where(cntDownImp == p.CntdwnQualBar, src, nz(self.cntdwnBuyQualPrice))
+            buyStart = cntDownImp == p.CntdwnBars
+            buyQualMask = _latch(self.cntdwnBuyQualMask, buyStart, np.isnan(cntDown),
+                                 (buyStart | (cntDownImp > p.CntdwnBars)) & (low <= buyQualPrice),
+                                 cntdwnIsQualified, cntdwnIsDeferred)
+        else:
+            sellQualPrice = buyQualPrice = np.full(self.n, na)
+            sellQualMask = np.where(cntUp == p.CntdwnBars, cntdwnIsQualified, na)
+            buyQualMask = np.where(cntDown == p.CntdwnBars, cntdwnIsQualified, na)
+        self.cntdwnSellQualPrice, self.cntdwnSellQualMask = sellQualPrice, sellQualMask
+        self.cntdwnBuyQualPrice, self.cntdwnBuyQualMask = buyQualPrice, buyQualMask
+
+        sellQualMaskImp = np.where(truthy(cntUpImp), sellQualMask, na)
+        buyQualMaskImp = np.where(truthy(cntDownImp), buyQualMask, na)
+        cntdwnSell = np.where(sellQualMaskImp == cntdwnIsQualified, src, na)
+        cntdwnSellDefer = np.where(sellQualMaskImp == cntdwnIsDeferred, src, na)
+        cntdwnBuy = np.where(buyQualMaskImp == cntdwnIsQualified, src, na)
+        cntdwnBuyDefer = np.where(buyQualMaskImp == cntdwnIsDeferred, src, na)
+
+        #---- TD Risk Level
+        # valuewhen(high == highest(n), tr, 0), see pine.rolling_extreme()
+        highestCntdwn, lowestCntdwn = self.highWindow.highest(p.CntdwnBars), self.lowWindow.lowest(p.CntdwnBars)
+        self.highestSetupTr = np.where(high == highestSetup, tr, self.highestSetupTr)
+        self.lowestSetupTr = np.where(low == lowestSetup, tr, self.lowestSetupTr)
+        self.highestCntdwnTr = np.where(high == highestCntdwn, tr, self.highestCntdwnTr)
+        self.lowestCntdwnTr = np.where(low == lowestCntdwn, tr, self.lowestCntdwnTr)
+
+        riskLevel = np.select(
+            [truthy(setupSell) | truthy(recycleUp),
+             truthy(setupBuy) | truthy(recycleDown),
+             truthy(cntdwnSell),
+             truthy(cntdwnBuy)],
+            [highestSetup + self.highestSetupTr,
+             lowestSetup - self.lowestSetupTr,
+             highestCntdwn + self.highestCntdwnTr,
+             lowestCntdwn - self.lowestCntdwnTr],
+            np.where(np.isnan(self.riskLevel), low, self.riskLevel))
+        self.riskLevel = riskLevel
+
+        return {
+            'PriceSource': src,
+            'setupPriceUp': setupPriceUp,
+            'setupPriceDown': setupPriceDown,
+            'setupPriceEqual': setupPriceEqual,
+            'setupCountUp': countUp,
+            'setupCountDown': countDown,
+            'setupSell': setupSell,
+            'setupBuy': setupBuy,
+            'setupSellCount': setupSellCount,
+            'setupBuyCount': setupBuyCount,
+            'setupSellPerfPrice': sellPerfPrice,
+            'setupSellPerfMask': sellMask,
+            'setupSellPerf': np.where(sellMask == setupIsPerfected, src, na),
+            'setupBuyPerfPrice': buyPerfPrice,
+            'setupBuyPerfMask': buyMask,
+            'setupBuyPerf': np.where(buyMask == setupIsPerfected, src, na),
+            'setupTrendSupport': support,
+            'setupTrendResist': resist,
+            'cntdwnPriceUp': cntdwnPriceUp,
+            'cntdwnPriceDown': cntdwnPriceDown,
+            'cntdwnCountUpRecycle': recycleUp,
+            'cntdwnCountDownRecycle': recycleDown,
+            'cntdwnCountUp': cntUp,
+            'cntdwnCountUpImp': cntUpImp,
+            'cntdwnCountDown': cntDown,
+            'cntdwnCountDownImp': cntDownImp,
+            'cntdwnSellQualPrice': sellQualPrice,
+            'cntdwnSellQualMask': sellQualMask,
+            'cntdwnSellQualMaskImp': sellQualMaskImp,
+            'cntdwnBuyQualPrice': buyQualPrice,
+            'cntdwnBuyQualMask': buyQualMask,
+            'cntdwnBuyQualMaskImp': buyQualMaskImp,
+            'cntdwnSell': cntdwnSell,
+            'cntdwnSellDefer': cntdwnSellDefer,
+            'cntdwnBuy': cntdwnBuy,
+            'cntdwnBuyDefer': cntdwnBuyDefer,
+            'riskLevel': riskLevel,
+        }
+
+    def preview(self, open, high, low, close):
+        """The outputs update() would return if the open bar closed now, leaving
+        the committed state as it was (see TDStream.preview)."""
+        committed = self.__dict__.copy()
+        rings = [(ring, ring.save()) for ring in (self.srcRing, self.highRing, self.lowRing,
+                                                  self.highWindow, self.lowWindow)]
+        out = TDTable.update(self, open, high, low, close)
+        self.__dict__.update(committed)
+        for ring, saved in rings:
+            ring.restore(saved)
+        return out
+
+    def _timed_update(self, open, high, low, close):
+        start = time.perf_counter()
+        out = self._update(open, high, low, close)
+        self.metrics.table(time.perf_counter() - start, out, self.n)
+        return out
+
+    def _ladder(self, window, prevCount, event, extreme):
+        # The script's extended TDST, evaluated for the symbols with a setup on this bar
+        step = self.params.SetupBars
+        steps = np.where(np.isnan(prevCount), 10, np.clip(np.ceil(prevCount / step), 1, 10))
+        level = np.full(self.n, na)
+        for k in np.unique(steps[event]):
+            rows = event & (steps == k)
+            length = int(k) * step
+            if window.count >= length:
+                level[rows] = extreme(window.last(length)[:, rows], axis=0)
+        return level
+
+
+def _latch(prev, start, cancel, hit, done, pending):
+    # (nz(mask[1]) >= done) or cancel ? na : start ? (hit ? done : pending) :
+    #    na(mask[1]) ? na : (hit ? done : mask[1])
+    mask = np.where(start, np.where(hit, done, pending),
+                    np.where(np.isnan(prev), na, np.where(hit, done, prev)))
+    return np.where((nz(prev) >= done) | cancel, na, mask)
+
+
+def _count(prev, priceMove, setup, cancel):
+    # na(priceMove) ? count[1] : cancel ? na : setup ? priceMove : count[1] + priceMove
+    # (an na count[1] stays na in the last branch)
+    count = np.where(~np.isnan(setup), priceMove, prev + priceMove)
+    count = np.where(cancel, na, count)
+    return np.where(np.isnan(priceMove), prev, count)
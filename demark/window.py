@@ -0,0 +1,114 @@
+"""Sliding-window structures shared by the engines."""
+
+from collections import deque
+
+import numpy as np
+
+na = float('nan')
+
+
+class RollingExtreme:
+    """highest()/lowest() over the last `length` bars, one bar at a time.
+
+    A monotonic deque of (bar, value): push() is amortized O(1) and the window
+    extreme is always at the front.
+    """
+
+    __slots__ = ('length', 'maximum', 'bar', 'queue')
+
+    def __init__(self, length, maximum=True):
+        self.length = length
+        self.maximum = maximum
+        self.bar = -1
+        self.queue = deque()
+
+    def push(self, value):
+        """Add the next bar's value and return the window extreme (na while filling)."""
+        self.bar += 1
+        queue = self.queue
+        if self.maximum:
+            while queue and queue[-1][1] <= value:
+                queue.pop()
+        else:
+            while queue and queue[-1][1] >= value:
+                queue.pop()
+        queue.append((self.bar, value))
+        if queue[0][0] <= self.bar - self.length:
+            queue.popleft()
+        return self.extreme()
+
+    def extreme(self):
+        if self.bar < self.length - 1:
+            return na
+        return self.queue[0][1]
+
+    def after(self, value):
+        """The extreme push(value) would return, leaving the window as it is."""
+        bar = self.bar + 1
+        if bar < self.length - 1:
+            return na
+        queue = self.queue
+        # Only the front can have left the window, and then the next entry is the
+        # extreme of the rest
+        front = queue[0] if queue and queue[0][0] > bar - self.length else queue[1] if len(queue) > 1 else None
+        if front is None:
+            return value
+        if self.maximum:
+            return value if value >= front[1] else front[1]
+        return value if value <= front[1] else front[1]
+
+
+class Ring:
+    """The last `size` values of N series advancing together, as a (size, N) ring.
+
+    The buffer is time-major: each push() writes one contiguous row, and window
+    reductions run down axis 0 over rows of N contiguous values, which NumPy
+    vectorizes across symbols. Every row is written twice, at pos and pos + size,
+    so any trailing window is one contiguous slice of the buffer.
+    """
+
+    __slots__ = ('size', 'buf', 'pos', 'count')
+
+    def __init__(self, n, size):
+        self.size = size
+        self.buf = np.full((2 * size, n), na)
+        self.pos = -1
+        self.count = 0
+
+    def push(self, values):
+        self.pos = (self.pos + 1) % self.size
+        self.buf[self.pos] = values
+        self.buf[self.pos + self.size] = values
+        self.count += 1
+
+    def save(self):
+        """What restore() needs to undo the next push(): the position, the count
+        and the row that push() overwrites."""
+        return self.pos, self.count, self.buf[(self.pos + 1) % self.size].copy()
+
+    def restore(self, saved):
+        self.pos, self.count, row = saved
+        overwritten = (self.pos + 1) % self.size
+        self.buf[overwritten] = row
+        self.buf[overwritten + self.size] = row
+
+    def last(self, length):
+        """(length, N) view of the last `length` values, oldest first."""
+        end = self.pos + self.size + 1
+        return self.buf[end - length:end]
+
+    def ago(self, k):
+        """series[k] for every series, na while fewer than k+1 values were pushed."""
+        if self.count <= k:
+            return np.full(self.buf.shape[1], na)
+        return self.buf[self.pos + self.size - k]
+
+    def highest(self, length):
+        if self.count < length:
+            return np.full(self.buf.shape[1], na)
+        return self.last(length).max(axis=0)
+
+    def lowest(self, length):
+        if self.count < length:
+            return np.full(self.buf.shape[1], na)
+        return self.last(length).min(axis=0)
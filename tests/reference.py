@@ -0,0 +1,266 @@
+"""Plain per-bar interpreter of tdsequential.py, the oracle of the parity tests.
+
+Each bar runs the script top to bottom on Python floats, with no closed forms,
+rings or carried-state shortcuts: x[k] reads the stored history, valuewhen()
+remembers its last value and highest()/lowest() rescan their window. Every
+valuewhen(), highest() and lowest() is evaluated on every bar, as the batch
+engine does. na is NaN: comparisons with it are false, except cntdwnPriceUp/Down,
+which the script tests with na() and so are na themselves.
+"""
+
+import math
+
+import numpy as np
+
+from demark.batch import SERIES
+from demark.params import PRICE_SOURCES, Params
+
+na = float('nan')
+isna = math.isnan
+
+
+def nz(x, replacement=0.0):
+    return replacement if isna(x) else x
+
+
+def truthy(x):
+    return not isna(x) and x != 0
+
+
+def run(open, high, low, close, params=Params()):
+    """{series name: ndarray} of every batch.SERIES series."""
+    p = params
+    o, h, l, c = ([float(v) for v in x] for x in (open, high, low, close))
+    src = [PRICE_SOURCES[p.PriceSource](*bar) for bar in zip(o, h, l, c)]
+    s = {name: [] for name in SERIES}
+    when = {}
+    lastSell = lastBuy = None
+    # Running low/high since the last sell/buy setup bar, for the exact TDST
+    sinceSellLow = sinceBuyHigh = na
+
+    def past(x, i, k):
+        return x[i - k] if i >= k else na
+
+    def prev(name, i):
+        return s[name][i - 1] if i else na
+
+    def valuewhen(key, cond, value):
+        if cond:
+            when[key] = value
+        return when.get(key, na)
+
+    def lowest(x, i, length):
+        return min(x[i - length + 1:i + 1]) if i + 1 >= length else na
+
+    def highest(x, i, length):
+        return max(x[i - length + 1:i + 1]) if i + 1 >= length else na
+
+    for i in range(len(c)):
+        out = {}
+
+        #---- TD Price Flips
+        prior = past(src, i, p.SetupLookback)
+        out['PriceSource'] = src[i]
+        out['setupPriceUp'] = src[i] > prior
+        out['setupPriceDown'] = src[i] < prior
+        out['setupPriceEqual'] = equal = src[i] == prior
+
+        #---- TD Setups
+        prevUp, prevDown = prev('setupCountUp', i), prev('setupCountDown', i)
+        if p.SetupEqualEnable:
+            countUp = nz(prevUp) + 1 if out['setupPriceUp'] or (truthy(prevUp) and equal) else 0
+            countDown = nz(prevDown) + 1 if out['setupPriceDown'] or (truthy(prevDown) and equal) else 0
+        else:
+            countUp = nz(prevUp) + 1 if out['setupPriceUp'] else 0
+            countDown = nz(prevDown) + 1 if out['setupPriceDown'] else 0
+        out['setupCountUp'], out['setupCountDown'] = countUp, countDown
+        sell = src[i] if countUp == p.SetupBars else na
+        buy = src[i] if countDown == p.SetupBars else na
+        out['setupSell'], out['setupBuy'] = sell, buy
+        if truthy(sell):
+            lastSell = i
+        if truthy(buy):
+            lastBuy = i
+        out['setupSellCount'] = na if lastSell is None else i - lastSell
+        out['setupBuyCount'] = na if lastBuy is None else i - lastBuy
+
+        # Perfected setups
+        first = p.SetupBars - p.SetupPerfLookback
+        a = valuewhen('sellA', countUp == first, h[i])
+        b = valuewhen('sellB', countUp == first + 1, h[i])
+        beforeEvent = valuewhen('sellC', countUp == p.SetupBars - 1, h[i])
+        atEvent = valuewhen('sellD', countUp == p.SetupBars, h[i])
+        price = (a if a >= b else b) if countUp == p.SetupBars else nz(prev('setupSellPerfPrice', i))
+        prevMask = prev('setupSellPerfMask', i)
+        if nz(prevMask) >= 2 or not isna(buy):
+            mask = na
+        elif countUp == p.SetupBars:
+            mask = 2 if beforeEvent >= price or atEvent >= price else 1
+        elif isna(prevMask):
+            mask = na
+        else:
+            mask = 2 if h[i] >= price else prevMask
+        out['setupSellPerfPrice'], out['setupSellPerfMask'] = price, mask
+        out['setupSellPerf'] = src[i] if mask == 2 else na
+
+        a = valuewhen('buyA', countDown == first, l[i])
+        b = valuewhen('buyB', countDown == first + 1, l[i])
+        beforeEvent = valuewhen('buyC', countDown == p.SetupBars - 1, l[i])
+        atEvent = valuewhen('buyD', countDown == p.SetupBars, l[i])
+        price = (a if a <= b else b) if countDown == p.SetupBars else nz(prev('setupBuyPerfPrice', i))
+        prevMask = prev('setupBuyPerfMask', i)
+        if nz(prevMask) >= 2 or not isna(sell):
+            mask = na
+        elif countDown == p.SetupBars:
+            mask = 2 if beforeEvent <= price or atEvent <= price else 1
+        elif isna(prevMask):
+            mask = na
+        else:
+            mask = 2 if l[i] <= price else prevMask
+        out['setupBuyPerfPrice'], out['setupBuyPerfMask'] = price, mask
+        out['setupBuyPerf'] = src[i] if mask == 2 else na
+
+        #---- TDST
+        sinceSellLow = l[i] if isna(sinceSellLow) else min(sinceSellLow, l[i])
+        sinceBuyHigh = h[i] if isna(sinceBuyHigh) else max(sinceBuyHigh, h[i])
+        if truthy(sell):
+            if p.SetupTrendExtend and p.SetupTrendExact:
+                support = sinceSellLow
+            elif p.SetupTrendExtend:
+                support = lowest(l, i, _ladder(prev('setupSellCount', i), p.SetupBars))
+            else:
+                support = lowest(l, i, p.SetupBars)
+            sinceSellLow = l[i]
+        else:
+            support = nz(prev('setupTrendSupport', i))
+        if truthy(buy):
+            if p.SetupTrendExtend and p.SetupTrendExact:
+                resist = sinceBuyHigh
+            elif p.SetupTrendExtend:
+                resist = highest(h, i, _ladder(prev('setupBuyCount', i), p.SetupBars))
+            else:
+                resist = highest(h, i, p.SetupBars)
+            sinceBuyHigh = h[i]
+        else:
+            resist = nz(prev('setupTrendResist', i))
+        out['setupTrendSupport'], out['setupTrendResist'] = support, resist
+
+        #---- TD Countdown
+        if p.CntdwnAggressive:
+            up, upPrior = h[i], past(h, i, p.CntdwnLookback)
+            down, downPrior = l[i], past(l, i, p.CntdwnLookback)
+        else:
+            up, upPrior = src[i], past(h, i, p.CntdwnLookback)
+            down, downPrior = src[i], past(l, i, p.CntdwnLookback)
+        priceUp = na if isna(upPrior) else float(up >= upPrior)
+        priceDown = na if isna(downPrior) else float(down <= downPrior)
+        out['cntdwnPriceUp'], out['cntdwnPriceDown'] = priceUp, priceDown
+
+        recycleUp = src[i] if countUp == 2 * p.SetupBars else na
+        recycleDown = src[i] if countDown == 2 * p.SetupBars else na
+        out['cntdwnCountUpRecycle'], out['cntdwnCountDownRecycle'] = recycleUp, recycleDown
+
+        prevCount = prev('cntdwnCountUp', i)
+        if isna(priceUp):
+            cntUp = prevCount
+        elif not isna(buy) or src[i] < support or not isna(recycleUp):
+            cntUp = na
+        elif not isna(sell):
+            cntUp = 1.0 if truthy(priceUp) else 0.0
+        elif isna(prevCount):
+            cntUp = na
+        else:
+            cntUp = prevCount + 1 if truthy(priceUp) else prevCount
+        cntUpImp = cntUp if truthy(priceUp) else na
+
+        prevCount = prev('cntdwnCountDown', i)
+        if isna(priceDown):
+            cntDown = prevCount
+        elif not isna(sell) or src[i] > resist or not isna(recycleDown):
+            cntDown = na
+        elif not isna(buy):
+            cntDown = 1.0 if truthy(priceDown) else 0.0
+        elif isna(prevCount):
+            cntDown = na
+        else:
+            cntDown = prevCount + 1 if truthy(priceDown) else prevCount
+        cntDownImp = cntDown if truthy(priceDown) else na
+        out['cntdwnCountUp'], out['cntdwnCountUpImp'] = cntUp, cntUpImp
+        out['cntdwnCountDown'], out['cntdwnCountDownImp'] = cntDown, cntDownImp
+
+        # Qualification
+        sellAtBars = valuewhen('sellBars', cntUpImp == p.CntdwnBars, h[i])
+        sellPastBars = valuewhen('sellPast', cntUpImp > p.CntdwnBars, h[i])
+        buyAtBars = valuewhen('buyBars', cntDownImp == p.CntdwnBars, l[i])
+        buyPastBars = valuewhen('buyPast', cntDownImp > p.CntdwnBars, l[i])
+        if p.CntdwnQualBar < p.CntdwnBars:
+            sellPrice = src[i] if cntUpImp == p.CntdwnQualBar else nz(prev('cntdwnSellQualPrice', i))
+            prevMask = prev('cntdwnSellQualMask', i)
+            if nz(prevMask) >= 2 or isna(cntUp):
+                sellMask = na
+            elif cntUpImp == p.CntdwnBars:
+                sellMask = 2 if sellAtBars >= sellPrice else 1
+            elif isna(prevMask):
+                sellMask = na
+            elif cntUpImp > p.CntdwnBars:
+                sellMask = 2 if sellPastBars >= sellPrice else prevMask
+            else:
+                sellMask = prevMask
+
+            buyPrice = src[i] if cntDownImp == p.CntdwnQualBar else nz(prev('cntdwnBuyQualPrice', i))
+            prevMask = prev('cntdwnBuyQualMask', i)
+            if nz(prevMask) >= 2 or isna(cntDown):
+                buyMask = na
+            elif cntDownImp == p.CntdwnBars:
+                buyMask = 2 if buyAtBars <= buyPrice else 1
+            elif isna(prevMask):
+                buyMask = na
+            elif cntDownImp > p.CntdwnBars:
+                buyMask = 2 if buyPastBars <= buyPrice else prevMask
+            else:
+                buyMask = prevMask
+        else:
+            sellPrice = buyPrice = na
+            sellMask = 2 if cntUp == p.CntdwnBars else na
+            buyMask = 2 if cntDown == p.CntdwnBars else na
+        sellMaskImp = sellMask if truthy(cntUpImp) else na
+        buyMaskImp = buyMask if truthy(cntDownImp) else na
+        out['cntdwnSellQualPrice'], out['cntdwnSellQualMask'] = sellPrice, sellMask
+        out['cntdwnBuyQualPrice'], out['cntdwnBuyQualMask'] = buyPrice, buyMask
+        out['cntdwnSellQualMaskImp'], out['cntdwnBuyQualMaskImp'] = sellMaskImp, buyMaskImp
+        out['cntdwnSell'] = cntdwnSell = src[i] if sellMaskImp == 2 else na
+        out['cntdwnSellDefer'] = src[i] if sellMaskImp == 1 else na
+        out['cntdwnBuy'] = cntdwnBuy = src[i] if buyMaskImp == 2 else na
+        out['cntdwnBuyDefer'] = src[i] if buyMaskImp == 1 else na
+
+        #---- TD Risk Level
+        tr = na if i == 0 else max(h[i] - l[i], abs(h[i] - c[i - 1]), abs(l[i] - c[i - 1]))
+        setupHigh, setupLow = highest(h, i, p.SetupBars), lowest(l, i, p.SetupBars)
+        cntdwnHigh, cntdwnLow = highest(h, i, p.CntdwnBars), lowest(l, i, p.CntdwnBars)
+        setupHighTr = valuewhen('riskA', h[i] == setupHigh, tr)
+        setupLowTr = valuewhen('riskB', l[i] == setupLow, tr)
+        cntdwnHighTr = valuewhen('riskC', h[i] == cntdwnHigh, tr)
+        cntdwnLowTr = valuewhen('riskD', l[i] == cntdwnLow, tr)
+        if truthy(sell) or truthy(recycleUp):
+            risk = setupHigh + setupHighTr
+        elif truthy(buy) or truthy(recycleDown):
+            risk = setupLow - setupLowTr
+        elif truthy(cntdwnSell):
+            risk = cntdwnHigh + cntdwnHighTr
+        elif truthy(cntdwnBuy):
+            risk = cntdwnLow - cntdwnLowTr
+        else:
+            risk = nz(prev('riskLevel', i), l[i])
+        out['riskLevel'] = risk
+
+        for name in SERIES:
+            s[name].append(out[name])
+    return {name: np.array(values, dtype=np.float64) for name, values in s.items()}
+
+
+def _ladder(prevCount, setupBars):
+    # The script's if/else ladder: the smallest k*SetupBars (k <= 10) covering setupCount[1]
+    for k in range(1, 10):
+        if prevCount <= k * setupBars:
+            return k * setupBars
+    return 10 * setupBars
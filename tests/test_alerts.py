@@ -0,0 +1,173 @@
+"""Alert delivery against local stand-in servers."""
+
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from demark.alerts import Alert, Dispatcher, FileSink, LiveAlerts, SocketSink, WebhookSink, from_events
+from demark.bench import ohlc
+from demark.events import compute_events
+from demark.stream import TDStream
+from demark.table import TDTable
+
+
+def alerts(n):
+    return [Alert('S%d' % (i % 7), i, 0, 'Sell Setup', 100.0 + i, 9) for i in range(n)]
+
+
+class StandIn:
+    """A local HTTP server recording the JSON array of every POST. It answers
+    `status`, and only once `gate` is set."""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.batches = []
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/hook' % self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = next(int(line.split(b':')[1]) for line in head.split(b'\r\n')
+                      if line.lower().startswith(b'content-length'))
+        body = await reader.readexactly(length)
+        await self.gate.wait()
+        if self.status == 200:
+            self.batches.append(json.loads(body))
+        writer.write(b'HTTP/1.1 %d X\r\nContent-Length: 0\r\n\r\n' % self.status)
+        await writer.drain()
+        writer.close()
+
+
+def test_batches_coalesce():
+    async def main():
+        async with StandIn() as server:
+            async with Dispatcher([WebhookSink(server.url)], batch_size=50) as dispatcher:
+                await dispatcher.publish(alerts(120))
+        return server.batches
+
+    batches = asyncio.run(main())
+    # Everything was queued within the linger, so batches are full up to the remainder
+    assert [len(batch) for batch in batches] == [50, 50, 20]
+    assert [alert['bar'] for batch in batches for alert in batch] == list(range(120))
+
+
+def test_backpressure():
+    async def main():
+        async with StandIn() as server:
+            server.gate.clear()
+            async with Dispatcher([WebhookSink(server.url)], queue_size=5, batch_size=1) as dispatcher:
+                publishing = asyncio.ensure_future(dispatcher.publish(alerts(20)))
+                await asyncio.sleep(0.1)
+                # One alert is held by the stalled sink, five wait in its queue
+                assert not publishing.done()
+                assert dispatcher._queues[0].qsize() == 5
+                server.gate.set()
+                await asyncio.wait_for(publishing, 5)
+        return server.batches
+
+    assert sum(len(batch) for batch in asyncio.run(main())) == 20
+
+
+def test_failing_sink_does_not_stall_others():
+    async def main():
+        async with StandIn() as good, StandIn(status=500) as failing:
+            sinks = [WebhookSink(failing.url), WebhookSink('http://127.0.0.1:1/closed', timeout=1.0),
+                     WebhookSink(good.url)]
+            dispatcher = Dispatcher(sinks, queue_size=10, batch_size=10)
+            dispatcher.start()
+            await asyncio.wait_for(dispatcher.publish(alerts(100)), 5)
+            await asyncio.wait_for(dispatcher.close(), 5)
+        return good.batches
+
+    assert sum(len(batch) for batch in asyncio.run(main())) == 100
+
+
+def test_stalled_socket_times_out():
+    async def main():
+        stalled = asyncio.Event()
+
+        async def never_read(reader, writer):
+            await stalled.wait()
+
+        server = await asyncio.start_server(never_read, '127.0.0.1', 0)
+        sink = SocketSink('127.0.0.1', server.sockets[0].getsockname()[1], timeout=0.2)
+        try:
+            # Enough data to fill the socket buffers, so drain() blocks
+            with pytest.raises(asyncio.TimeoutError):
+                for _ in range(100):
+                    await sink.send(alerts(20000))
+        finally:
+            stalled.set()
+            server.close()
+            await sink.close()
+
+    asyncio.run(main())
+
+
+def test_publish_requires_start():
+    dispatcher = Dispatcher([])
+    with pytest.raises(RuntimeError):
+        asyncio.run(dispatcher.publish(alerts(1)))
+
+
+def test_slow_sink_does_not_hold_others():
+    async def main():
+        async with StandIn() as slow, StandIn() as fast:
+            slow.gate.clear()
+            dispatcher = Dispatcher([WebhookSink(slow.url), WebhookSink(fast.url)], queue_size=5, batch_size=1)
+            dispatcher.start()
+            publishing = asyncio.ensure_future(dispatcher.publish(alerts(30)))
+            # The slow sink's queue is full, yet the fast one gets everything
+            for _ in range(100):
+                if sum(map(len, fast.batches)) == 30:
+                    break
+                await asyncio.sleep(0.02)
+            assert sum(map(len, fast.batches)) == 30
+            assert not publishing.done()
+            slow.gate.set()
+            await asyncio.wait_for(publishing, 5)
+            await asyncio.wait_for(dispatcher.close(), 5)
+        return sum(map(len, fast.batches)), sum(map(len, slow.batches))
+
+    assert asyncio.run(main()) == (30, 30)
+
+
+@pytest.mark.parametrize('table', [False, True])
+def test_live_alerts(tmp_path, table):
+    bars = ohlc(600, 3)
+    names = ['A', 'B']
+    expected = sorted(alert for k, name in enumerate(names)
+                      for alert in from_events(name, compute_events(*(x * (1 + k) for x in bars))))
+    assert expected
+
+    async def main():
+        path = str(tmp_path / 'alerts.jsonl')
+        async with Dispatcher([FileSink(path)]) as dispatcher:
+            if table:
+                live = LiveAlerts(dispatcher, TDTable(2), names)
+                for bar in zip(*bars):
+                    await live.update(*(np.array([x, 2 * x]) for x in bar))
+            else:
+                for k, name in enumerate(names):
+                    live = LiveAlerts(dispatcher, TDStream(), name)
+                    for bar in zip(*bars):
+                        await live.update(*(x * (1 + k) for x in bar))
+        with open(path) as f:
+            return sorted(Alert(**json.loads(line)) for line in f)
+
+    assert asyncio.run(main()) == expected
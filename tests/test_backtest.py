@@ -0,0 +1,76 @@
+"""The event study against a per-event brute force."""
+
+import math
+
+import numpy as np
+import pytest
+
+from demark.backtest import RISK_EVENTS, event_study
+from demark.batch import compute
+from demark.bench import ohlc
+from demark.events import EVENTS
+from demark.params import Params
+
+HORIZONS = (1, 5, 20)
+
+
+def universe(lengths, seed=0):
+    symbols = [ohlc(n, seed + k) if n else [np.empty(0)] * 4 for k, n in enumerate(lengths)]
+    bars = {field: np.concatenate([s[i] for s in symbols]) for i, field in enumerate(('open', 'high', 'low', 'close'))}
+    return bars, np.concatenate([[0], np.cumsum(lengths)])
+
+
+def brute_force(bars, offsets, event, s):
+    """(risk, returns, mfe, mae) of one event, bar by bar."""
+    name, a, b = EVENTS[event['kind']][0], offsets[event['symbol']], offsets[event['symbol'] + 1]
+    i, side = event['bar'], event['side']
+    local = i - a
+    setter = next((group for group in RISK_EVENTS if any(not math.isnan(s[n][local]) and s[n][local]
+                                                         for n in group)), ())
+    risk = float(s['riskLevel'][local]) if name in setter else math.nan
+    entry = bars['close'][i]
+    returns, mfe, mae = [], [], []
+    for horizon in HORIZONS:
+        if i + horizon >= b:
+            returns.append(math.nan), mfe.append(math.nan), mae.append(math.nan)
+            continue
+        highs, lows = bars['high'][i + 1:i + horizon + 1], bars['low'][i + 1:i + horizon + 1]
+        returns.append(side * (bars['close'][i + horizon] / entry - 1))
+        favourable = highs.max() - entry if side > 0 else entry - lows.min()
+        adverse = entry - lows.min() if side > 0 else highs.max() - entry
+        distance = abs(entry - risk) if abs(entry - risk) > 0 else math.nan
+        mfe.append(favourable / distance)
+        mae.append(adverse / distance)
+    return risk, returns, mfe, mae
+
+
+def test_brute_force():
+    bars, offsets = universe([800, 0, 600, 50])
+    combinations = [Params(), Params(SetupBars=5, CntdwnBars=8, CntdwnQualBar=5)]
+    study = event_study(bars, offsets, combinations, HORIZONS)
+    assert len(study.events)
+    runs = {}
+    for k, (event, returns, mfe, mae) in enumerate(zip(study.events, study.returns, study.mfe, study.mae)):
+        symbol, combo = int(event['symbol']), int(event['combo'])
+        if (symbol, combo) not in runs:
+            a, b = offsets[symbol], offsets[symbol + 1]
+            runs[symbol, combo] = compute(*(bars[f][a:b] for f in ('open', 'high', 'low', 'close')),
+                                          combinations[combo])
+        risk, *expected = brute_force(bars, offsets, event, runs[symbol, combo])
+        np.testing.assert_array_equal(event['risk'], risk, err_msg='event %d' % k)
+        for actual, wanted in zip((returns, mfe, mae), expected):
+            np.testing.assert_allclose(actual, wanted, rtol=1e-12, err_msg='event %d' % k)
+        if not math.isnan(risk):
+            # A level set by the event is beyond the entry, against the trade
+            assert event['side'] * (event['entry'] - risk) >= 0
+    risky = ~np.isnan(study.events['risk'])
+    assert risky.any() and not risky.all()
+    assert not study.stopped[~risky].any()
+
+
+def test_unknown_kinds():
+    bars, offsets = universe([100])
+    with pytest.raises(ValueError):
+        event_study(bars, offsets, kinds=('setupSell', 'setupSel'))
+    study = event_study(bars, offsets, kinds=('setupSell',))
+    assert (study.events['kind'] == 0).all()
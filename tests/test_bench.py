@@ -0,0 +1,27 @@
+"""The benchmark harness at in-memory and chunked sizes."""
+
+import numpy as np
+
+from demark.batch import SECTIONS
+from demark.bench import bench_batch, bench_table, ohlc, walk
+
+
+def test_walk():
+    whole = list(walk(500, 3, chunk_size=500))
+    assert len(whole) == 1
+    for x, y in zip(whole[0], ohlc(500, 3)):
+        np.testing.assert_array_equal(x, y)
+    parts = list(walk(1050, 3, chunk_size=200))
+    assert [len(part[3]) for part in parts] == [200] * 5 + [50]
+    for before, after in zip(parts, parts[1:]):
+        # Each chunk opens at the last close of the one before
+        assert after[0][0] == before[3][-1]
+
+
+def test_stages():
+    names = {section.run.__name__ for section in SECTIONS} | {'setup_trend_extended'}
+    for chunk_size in (10 ** 7, 700):
+        result = bench_batch(2000, 2, chunk_size=chunk_size)
+        assert set(result['stages']) == names
+        assert result['chunked'] == (chunk_size < 2000)
+    assert bench_table(300, 2, chunk_size=100)['bars'] == 300
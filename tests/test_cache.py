@@ -0,0 +1,66 @@
+"""The result cache against fresh runs as histories grow and change."""
+
+import numpy as np
+
+from demark.batch import SERIES, compute
+from demark.bench import ohlc
+from demark.cache import ResultCache
+from demark.params import Params
+
+from test_parity import assert_same
+
+PARAMS = Params(SetupTrendExtend=True)
+
+
+def history(n, seed=0):
+    return [x[:n].copy() for x in ohlc(1000, seed)]
+
+
+def test_append():
+    bars = history(1000)
+    cache = ResultCache()
+    for n in (100, 101, 350, 1000, 1000):
+        assert_same(compute(*(x[:n] for x in bars), PARAMS),
+                    cache.get('X', *(x[:n] for x in bars), PARAMS), where=' at %d bars' % n)
+    assert (cache.misses, cache.extensions, cache.hits) == (1, 3, 1)
+
+
+def test_mid_history_revision():
+    bars = history(1000)
+    cache = ResultCache()
+    cache.get('X', *bars, PARAMS)
+    bars[1][400] += 5
+    assert_same(compute(*bars, PARAMS), cache.get('X', *bars, PARAMS))
+    cache.get('X', *(x[:600] for x in bars), PARAMS)
+    bars[3][200] -= 1
+    assert_same(compute(*bars, PARAMS), cache.get('X', *bars, PARAMS))
+    assert cache.misses == 4
+
+
+def test_truncated_history():
+    bars = history(1000)
+    cache = ResultCache()
+    cache.get('X', *bars, PARAMS)
+    # A shorter history that differs from the cached one on its last bars
+    short = [x[:500].copy() for x in bars]
+    short[3][-1] += 3
+    assert_same(compute(*short, PARAMS), cache.get('X', *short, PARAMS))
+    assert cache.misses == 2
+
+
+def test_na_bars_hit():
+    bars = history(500)
+    for x in bars:
+        x[250] = np.nan
+    cache = ResultCache()
+    cache.get('X', *bars, PARAMS)
+    cache.get('X', *bars, PARAMS)
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_more_outputs_recompute():
+    bars = history(300)
+    cache = ResultCache()
+    cache.get('X', *bars, PARAMS, outputs=('setupCountUp',))
+    assert_same(compute(*bars, PARAMS), cache.get('X', *bars, PARAMS), SERIES)
+    assert cache.misses == 2
@@ -0,0 +1,30 @@
+"""The sparse event log."""
+
+import numpy as np
+
+from demark.batch import compute
+from demark.bench import ohlc
+from demark.events import EVENTS, SOURCES, compute_events, from_series, kind
+
+
+def test_log_matches_series():
+    bars = ohlc(2000, 11)
+    s = compute(*bars)
+    log = compute_events(*bars)
+    for k, (name, _, countName) in enumerate(EVENTS):
+        records = log[log['kind'] == k]
+        values = np.asarray(s[name], dtype=np.float64)
+        fired = np.flatnonzero(~np.isnan(values) & (values != 0))
+        np.testing.assert_array_equal(records['bar'], fired, err_msg=name)
+        np.testing.assert_array_equal(records['price'], values[fired])
+        np.testing.assert_array_equal(records['count'], np.nan_to_num(np.asarray(s[countName], float)[fired]))
+    assert (np.diff(log['bar']) >= 0).all()
+
+
+def test_long_count():
+    # A countdown running for more bars than an int16 holds
+    s = {name: np.full(3, np.nan) for name in SOURCES}
+    s['cntdwnSellDefer'][2] = 101.5
+    s['cntdwnCountUp'][:] = [39998, 39999, 40000]
+    log = from_series(s, start=10)
+    assert log.tolist() == [(12, kind('cntdwnSellDefer'), 101.5, 40000)]
@@ -0,0 +1,30 @@
+"""Multi-timeframe aggregation over a universe of symbols."""
+
+import numpy as np
+
+from demark.batch import SERIES
+from demark.bench import ohlc
+from demark.mtf import MultiTimeframe
+
+from test_parity import assert_same
+
+
+def test_reused_buffers():
+    # A feed handler refilling the same arrays for every bar must get the same
+    # bars as one passing fresh arrays, including across a gap in the data
+    symbols = [ohlc(600, seed) for seed in range(3)]
+    times = np.arange(600) * 60
+    times[300:] += 7 * 60
+    fresh = MultiTimeframe({'5m': 300, '1h': 3600}, symbols=3)
+    reused = MultiTimeframe({'5m': 300, '1h': 3600}, symbols=3)
+    buffers = np.empty((4, 3))
+    for i, time in enumerate(times):
+        bar = [np.array([bars[field][i] for bars in symbols]) for field in range(4)]
+        buffers[:] = bar
+        expected = fresh.update(int(time), *bar)
+        actual = reused.update(int(time), *buffers)
+        assert [(name, start) for name, start, _ in actual] == [(name, start) for name, start, _ in expected]
+        for (_, _, want), (_, _, got) in zip(expected, actual):
+            assert_same(want, got, where=' at bar %d' % i)
+        buffers[:] = np.nan
+    assert len(fresh.flush()) == 2
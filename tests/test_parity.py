@@ -0,0 +1,121 @@
+"""Every engine against the per-bar reference interpreter, over random inputs."""
+
+import os
+
+import numpy as np
+import pytest
+
+from demark.batch import SERIES, compute
+from demark.bench import REGIMES, ohlc
+from demark.chunked import compute_chunked, compute_parallel
+from demark.params import _INPUT_RANGES, PRICE_SOURCES, Params
+from demark.stream import TDStream
+from demark.sweep import grid, sweep
+from demark.table import TDTable
+
+from reference import run
+
+BARS = 1000
+
+
+def random_params(rng, **fixed):
+    """Params drawn uniformly over the input ranges."""
+    values = {name: int(rng.integers(lo, hi + 1)) for name, (lo, hi) in _INPUT_RANGES.items()}
+    values.update({name: bool(rng.integers(2)) for name in
+                   ('SetupEqualEnable', 'SetupTrendExtend', 'SetupTrendExact', 'CntdwnAggressive')})
+    values['PriceSource'] = str(rng.choice(sorted(PRICE_SOURCES)))
+    values.update(fixed)
+    return Params(**values)
+
+
+def random_case(seed, **fixed):
+    rng = np.random.default_rng(seed)
+    regime = str(rng.choice(('mixed',) + REGIMES))
+    return ohlc(BARS, seed, regime), random_params(rng, **fixed)
+
+
+def assert_same(expected, actual, names=SERIES, where=''):
+    for name in names:
+        np.testing.assert_array_equal(np.asarray(actual[name], dtype=np.float64), expected[name],
+                                      err_msg='%s%s' % (name, where))
+
+
+CASES = [pytest.param(seed, {}, id='random-%d' % seed) for seed in range(24)] + [
+    pytest.param(100, {'SetupEqualEnable': True}, id='equal'),
+    pytest.param(101, {'CntdwnQualBar': 13, 'CntdwnBars': 13}, id='qualbar-equal'),
+    pytest.param(102, {'CntdwnQualBar': 20, 'CntdwnBars': 5}, id='qualbar-above'),
+    pytest.param(103, {'SetupTrendExtend': True, 'SetupTrendExact': False}, id='ladder'),
+    pytest.param(104, {'SetupTrendExtend': True, 'SetupTrendExact': True}, id='exact'),
+    pytest.param(105, {'CntdwnAggressive': True}, id='aggressive'),
+]
+
+
+@pytest.mark.parametrize('seed, fixed', CASES)
+def test_batch(seed, fixed):
+    bars, params = random_case(seed, **fixed)
+    assert_same(run(*bars, params), compute(*bars, params))
+
+
+@pytest.mark.parametrize('equal', [False, True])
+def test_batch_flat(equal):
+    # Flat data repeats prices, so setupPriceEqual and equal counting matter
+    bars = ohlc(BARS, 7, 'flat')
+    params = Params(SetupEqualEnable=equal, SetupLookback=1)
+    expected = run(*bars, params)
+    assert expected['setupPriceEqual'].any()
+    assert_same(expected, compute(*bars, params))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_stream(seed):
+    bars, params = random_case(200 + seed)
+    expected = run(*bars, params)
+    stream = TDStream(params)
+    for i, bar in enumerate(zip(*bars)):
+        out = stream.update(*bar)
+        assert_same({name: expected[name][i] for name in SERIES}, out, where=' at bar %d' % i)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_table(seed):
+    rng = np.random.default_rng(300 + seed)
+    params = random_params(rng)
+    symbols = [ohlc(BARS, 300 + seed * 10 + k, str(rng.choice(REGIMES))) for k in range(5)]
+    expected = [run(*bars, params) for bars in symbols]
+    table = TDTable(len(symbols), params)
+    for i in range(BARS):
+        out = table.update(*(np.array([bars[field][i] for bars in symbols]) for field in range(4)))
+        for k, reference in enumerate(expected):
+            assert_same({name: reference[name][i] for name in SERIES}, {name: out[name][k] for name in SERIES},
+                        where=' of symbol %d at bar %d' % (k, i))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_chunked(seed):
+    bars, params = random_case(400 + seed)
+    expected = compute(*bars, params)
+    for chunk_size in (37, 150, BARS):
+        assert_same(expected, compute_chunked(*bars, params, chunk_size=chunk_size), where=' chunk %d' % chunk_size)
+
+
+def test_parallel(monkeypatch):
+    # Workers are capped at the CPU count, which may be one here
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    bars, params = random_case(500)
+    expected = compute(*bars, params)
+    # A speculative halo this short makes segments rerun
+    assert_same(expected, compute_parallel(*bars, params, workers=2, segments=6, speculative_halo=16))
+    assert_same(expected, compute_parallel(*bars, params, workers=1, segments=3, speculative_halo=16))
+
+
+@pytest.mark.parametrize('max_bytes', [256 * 2 ** 20, 0])
+def test_sweep(max_bytes):
+    # max_bytes=0 evicts every section result as soon as the next one is cached
+    bars = ohlc(BARS, 600)
+    combinations = grid(Params(SetupTrendExtend=True), SetupBars=(5, 9), SetupPerfLookback=(2, 3),
+                        CntdwnBars=(8, 13), CntdwnQualBar=(8, 13), SetupEqualEnable=(False, True))
+    seen = 0
+    for params, out in sweep(*bars, combinations, SERIES, max_bytes):
+        assert_same(run(*bars, params), out, where=' of %r' % (params,))
+        seen += 1
+    assert seen == len(combinations)
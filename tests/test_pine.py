@@ -0,0 +1,28 @@
+"""Pine built-ins against their per-bar definitions."""
+
+import numpy as np
+import pytest
+
+from demark import pine
+from demark.bench import ohlc
+
+
+@pytest.mark.parametrize('length', [1, 2, 9, 13])
+def test_rolling_extreme_is_valuewhen(length):
+    _, high, low, _ = ohlc(2000, length)
+    for x, maximum in ((high, True), (low, False)):
+        extreme, index = pine.rolling_extreme(x, length, maximum)
+        reduce = max if maximum else min
+        last, windowExtreme = -1, []
+        for i in range(len(x)):
+            window = x[max(i - length + 1, 0):i + 1].tolist()
+            expected = reduce(window) if i >= length - 1 else np.nan
+            np.testing.assert_array_equal(extreme[i], expected)
+            # valuewhen(x == highest(x, length), ...)
+            last = i if x[i] == expected else last
+            assert index[i] == last
+            if i >= length - 1:
+                windowExtreme.append(i - window[::-1].index(expected))
+        if length > 1:
+            # Not the bar holding the current window's extreme
+            assert (index[length - 1:] != windowExtreme).any()
@@ -0,0 +1,56 @@
+"""Intrabar previews leave the engine as it was and match the closing update."""
+
+import numpy as np
+import pytest
+
+from demark.batch import SERIES
+from demark.bench import ohlc
+from demark.snapshot import state
+from demark.stream import TDStream
+from demark.table import TDTable
+
+from test_parity import assert_same, random_params
+
+
+def ticks(rng, bar):
+    """Partial bars leading up to `bar`: (open, high, low, last) so far."""
+    open, high, low, close = bar
+    for last in rng.uniform(low, high, size=3):
+        yield open, max(open, last), min(open, last), last
+
+
+def assert_state(expected, engine, where):
+    actual = state(engine)
+    assert sorted(actual) == sorted(expected)
+    for name, values in expected.items():
+        np.testing.assert_array_equal(actual[name], values, err_msg='%s%s' % (name, where))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_stream(seed):
+    rng = np.random.default_rng(900 + seed)
+    stream = TDStream(random_params(rng))
+    for i, bar in enumerate(zip(*ohlc(500, 900 + seed))):
+        before = state(stream)
+        for tick in ticks(rng, bar):
+            stream.preview(*tick)
+            assert_state(before, stream, ' after a tick of bar %d' % i)
+        preview = {name: np.float64(v) for name, v in stream.preview(*bar).items()}
+        assert_state(before, stream, ' after previewing bar %d' % i)
+        assert_same(preview, stream.update(*bar), SERIES, where=' at bar %d' % i)
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_table(seed):
+    rng = np.random.default_rng(950 + seed)
+    symbols = [ohlc(300, 950 + 10 * seed + k) for k in range(5)]
+    table = TDTable(len(symbols), random_params(rng))
+    for i in range(300):
+        bar = [np.array([s[field][i] for s in symbols]) for field in range(4)]
+        before = state(table)
+        for tick in zip(*(ticks(rng, [x[k] for x in bar]) for k in range(len(symbols)))):
+            table.preview(*(np.array(values) for values in zip(*tick)))
+            assert_state(before, table, ' after a tick of bar %d' % i)
+        preview = {name: np.asarray(v, dtype=np.float64).copy() for name, v in table.preview(*bar).items()}
+        assert_state(before, table, ' after previewing bar %d' % i)
+        assert_same(preview, table.update(*bar), SERIES, where=' at bar %d' % i)
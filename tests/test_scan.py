@@ -0,0 +1,52 @@
+"""The universe scanner against the batch engine, symbol by symbol."""
+
+import numpy as np
+import pytest
+
+from demark import pine
+from demark.batch import ALERTS, FIELDS, compute
+from demark.params import Params
+from demark.scan import flag, scan
+
+from test_backtest import universe
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('params', [Params(), Params(SetupBars=5, CntdwnBars=8, SetupTrendExtend=True)])
+def test_matches_compute(workers, params):
+    lengths = [700, 0, 450, 1, 0, 300]
+    bars, offsets = universe(lengths, seed=3)
+    result = scan(bars, offsets, params, workers=workers)
+    np.testing.assert_array_equal(result.offsets, offsets)
+    assert sum(w['symbols'] for w in result.workers.values()) == len(lengths)
+    assert sum(w['bars'] for w in result.workers.values()) == sum(lengths)
+    fired = 0
+    for i, (a, b) in enumerate(zip(offsets[:-1], offsets[1:])):
+        s = compute(*(bars[field][a:b] for field in FIELDS), params)
+        for name, _ in ALERTS:
+            expected = pine.truthy(s[name])
+            np.testing.assert_array_equal(result.flags[a:b] & flag(name) != 0, expected,
+                                          err_msg='%s of symbol %d' % (name, i))
+            fired += expected.sum()
+        for name in ('setupTrendSupport', 'setupTrendResist'):
+            np.testing.assert_array_equal(getattr(result, name)[a:b], s[name],
+                                          err_msg='%s of symbol %d' % (name, i))
+    assert fired
+
+
+def test_empty_universe():
+    bars = {field: np.empty(0) for field in FIELDS}
+    result = scan(bars, [0, 0, 0], workers=2)
+    assert result.flags.shape == result.setupTrendSupport.shape == (0,)
+
+
+def test_memmap_input(tmp_path):
+    bars, offsets = universe([200, 0, 300], seed=5)
+    mapped = {}
+    for field in FIELDS:
+        np.save(tmp_path / (field + '.npy'), bars[field])
+        mapped[field] = np.load(tmp_path / (field + '.npy'), mmap_mode='r')
+    expected = scan(bars, offsets, workers=1)
+    actual = scan(mapped, offsets, workers=2)
+    for want, got in zip(expected[:3], actual[:3]):
+        np.testing.assert_array_equal(got, want)
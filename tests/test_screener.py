@@ -0,0 +1,49 @@
+"""The screener index against a scan of the current state."""
+
+import numpy as np
+
+from demark.bench import ohlc
+from demark.screener import FIELDS, LEVELS, Screener
+from demark.table import TDTable
+
+
+def test_index_follows_table():
+    rng = np.random.default_rng(5)
+    symbols = ['S%d' % k for k in range(40)]
+    bars = [ohlc(400, k) for k in range(len(symbols))]
+    table, screener = TDTable(len(symbols)), Screener(symbols)
+    for i in range(400):
+        close = np.array([b[3][i] for b in bars])
+        out = table.update(*(np.array([b[field][i] for b in bars]) for field in range(3)), close)
+        screener.update(out, close)
+        for field in FIELDS:
+            values = np.asarray(out[field], dtype=np.float64)
+            for value in set(values[~np.isnan(values)].tolist()) | {-1.0}:
+                assert screener.where(field, value) == {s for s, v in zip(symbols, values) if v == value}
+            assert screener.where(field, None) == {s for s, v in zip(symbols, values) if np.isnan(v)}
+            expected = {}
+            for v in values.tolist():
+                key = None if v != v else v
+                expected[key] = expected.get(key, 0) + 1
+            assert screener.counts(field) == expected
+        for level in LEVELS:
+            value = np.asarray(out[level], dtype=np.float64)
+            fraction = float(rng.choice((0.0, 0.005, 0.02, 0.1)))
+            assert screener.near(level, fraction) == {
+                s for s, p, v in zip(symbols, close, value) if v > 0 and abs(p / v - 1) <= fraction}
+
+
+def test_where_several_values():
+    screener = Screener(['A', 'B', 'C'])
+    out = {field: np.array([1.0, 2.0, np.nan]) for field in FIELDS}
+    out.update({level: np.array([100.0, 0.0, 100.0]) for level in LEVELS})
+    screener.update(out, np.array([100.5, 50.0, 110.0]))
+    assert screener.where('setupCountUp', 1, 2) == {'A', 'B'}
+    assert screener.counts('setupCountUp') == {1.0: 1, 2.0: 1, None: 1}
+    assert screener.near('setupTrendSupport', 0.01) == {'A'}
+    out['setupCountUp'] = np.array([2.0, 2.0, 2.0])
+    out['setupTrendSupport'] = np.array([100.0, 50.0, 110.0])
+    screener.update(out, np.array([100.5, 50.0, 110.0]))
+    assert screener.where('setupCountUp', 2) == {'A', 'B', 'C'}
+    assert screener.counts('setupCountUp') == {2.0: 3}
+    assert screener.near('setupTrendSupport', 0.0) == {'B', 'C'}
@@ -0,0 +1,89 @@
+"""The query server over a small bar store."""
+
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from demark.batch import compute
+from demark.bench import ohlc
+from demark.params import Params
+from demark.server import QueryServer
+from demark.store import build
+
+from test_parity import assert_same
+
+SYMBOLS = {'A': 0, 'B': 1, 'C': 2, 'D': 3}
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    path = tmp_path_factory.mktemp('bars')
+    sources = {}
+    for symbol, seed in SYMBOLS.items():
+        sources[symbol] = str(path / (symbol + '.csv'))
+        with open(sources[symbol], 'w') as f:
+            f.write('open,high,low,close\n')
+            for bar in zip(*ohlc(400 + 50 * seed, seed)):
+                f.write('%r,%r,%r,%r\n' % tuple(map(float, bar)))
+    return build(str(path / 'store'), sources, workers=1)
+
+
+def test_batch_split_across_workers(store):
+    async def main():
+        async with QueryServer(store, workers=2, window=0.05) as server:
+            queries = [(symbol, Params(SetupBars=bars), -100)
+                       for symbol in SYMBOLS for bars in (9, 8)] + [('A', Params(), 10)]
+            answers = await asyncio.gather(*(server.query(symbol, params, start)
+                                             for symbol, params, start in queries))
+            return server.batches, queries, answers
+
+    batches, queries, answers = asyncio.run(main())
+    assert batches == 1
+    for (symbol, params, start), answer in zip(queries, answers):
+        expected = compute(*store.ohlc(symbol), params)
+        assert_same({name: values[start:] for name, values in expected.items()}, answer.series,
+                    where=' of %s' % symbol)
+
+
+@pytest.mark.parametrize('inputs', [
+    {'SetupEqualEnable': 'false'},
+    {'SetupEqualEnable': 0},
+    {'SetupBars': 9.5},
+    {'SetupBars': '9'},
+    {'SetupBars': True},
+    {'PriceSource': 3},
+    {'Bogus': 1},
+    ['SetupBars', 9],
+])
+def test_inputs_are_typed(store, inputs):
+    async def main():
+        async with QueryServer(store, workers=1) as server:
+            listener = await server.listen('127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection('127.0.0.1', listener.sockets[0].getsockname()[1])
+            for id, request in enumerate([{'symbol': 'A', 'inputs': inputs, 'start': -1},
+                                          {'symbol': 'A', 'inputs': {'SetupEqualEnable': True}, 'start': -1}]):
+                writer.write(json.dumps(dict(request, id=id)).encode() + b'\n')
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in range(2)]
+            writer.close()
+            return {response['id']: response for response in responses}
+
+    responses = asyncio.run(main())
+    assert 'error' in responses[0] and 'series' not in responses[0]
+    assert np.asarray(responses[1]['series']['setupCountUp']).shape == (1,)
+
+
+def test_ranges_share_cached_history(store):
+    async def main():
+        async with QueryServer(store, workers=1) as server:
+            answers = []
+            for start, stop in ((0, None), (10, 50), (-5, None), (0, 1)):
+                answers.append(await server.query('B', Params(), start, stop))
+            return answers
+
+    expected = compute(*store.ohlc('B'), Params())
+    for answer in asyncio.run(main()):
+        assert_same({name: values[answer.start:answer.stop] for name, values in expected.items()}, answer.series,
+                    where=' over %d:%d' % (answer.start, answer.stop))
@@ -0,0 +1,72 @@
+"""Snapshots restore engines that continue exactly like the originals."""
+
+import json
+
+import numpy as np
+import pytest
+
+from demark.batch import SERIES
+from demark.bench import ohlc
+from demark.snapshot import Checkpoint, load, save
+from demark.stream import TDStream
+from demark.table import TDTable
+
+from test_parity import assert_same, random_params
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_stream_round_trip(tmp_path, seed):
+    rng = np.random.default_rng(700 + seed)
+    params = random_params(rng)
+    bars = list(zip(*ohlc(600, 700 + seed)))
+    cut = int(rng.integers(1, 500))
+    stream = TDStream(params)
+    for bar in bars[:cut]:
+        stream.update(*bar)
+    save(stream, str(tmp_path / 'stream.npz'))
+    restored = load(str(tmp_path / 'stream.npz'))
+    assert restored.params == params
+    for i, bar in enumerate(bars[cut:]):
+        assert_same({name: np.float64(v) for name, v in stream.update(*bar).items()}, restored.update(*bar),
+                    SERIES, where=' at bar %d' % (cut + i))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_table_round_trip(tmp_path, seed):
+    rng = np.random.default_rng(800 + seed)
+    params = random_params(rng)
+    symbols = [ohlc(500, 800 + 10 * seed + k) for k in range(6)]
+    bars = [[np.array([s[field][i] for s in symbols]) for field in range(4)] for i in range(500)]
+    cut = int(rng.integers(1, 400))
+    table = TDTable(len(symbols), params)
+    for bar in bars[:cut]:
+        table.update(*bar)
+    save(table, str(tmp_path / 'table.npz'))
+    restored = load(str(tmp_path / 'table.npz'))
+    for i, bar in enumerate(bars[cut:]):
+        expected = {name: np.asarray(v, dtype=np.float64).copy() for name, v in table.update(*bar).items()}
+        assert_same(expected, restored.update(*bar), SERIES, where=' at bar %d' % (cut + i))
+
+
+def test_checkpoint(tmp_path):
+    now = [0.0]
+    stream = TDStream()
+    checkpoint = Checkpoint(stream, str(tmp_path / 'state.npz'), every=10, clock=lambda: now[0])
+    assert not checkpoint()
+    now[0] = 10.0
+    assert checkpoint()
+    assert not checkpoint()
+    assert checkpoint(force=True)
+
+
+def test_rejects_other_versions(tmp_path):
+    path = str(tmp_path / 'state.npz')
+    save(TDStream(), path)
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    header = json.loads(arrays['header'].tobytes())
+    header['version'] += 1
+    arrays['header'] = np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)
+    np.savez(path, **arrays)
+    with pytest.raises(ValueError, match='version'):
+        load(path)
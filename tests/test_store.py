@@ -0,0 +1,107 @@
+"""Building and reading the bar store."""
+
+import os
+
+import numpy as np
+import pytest
+
+from demark.batch import FIELDS
+from demark.bench import ohlc
+from demark.params import PRICE_SOURCES
+from demark.store import BarStore, build, read
+
+
+def write_csv(path, bars, header='open,high,low,close', times=None):
+    with open(path, 'w') as f:
+        f.write(header + '\n')
+        for i, bar in enumerate(zip(*bars)):
+            row = ['%r' % float(x) for x in bar]
+            if times is not None:
+                row.insert(0, str(times[i]))
+            f.write(','.join(row) + '\n')
+    return str(path)
+
+
+def test_csv_round_trip(tmp_path):
+    symbols = {'A': ohlc(300, 0), 'B': ohlc(0, 1), 'C': ohlc(120, 2)}
+    sources = {name: write_csv(tmp_path / (name + '.csv'), bars, 'open,High, low,CLOSE')
+               for name, bars in symbols.items()}
+    store = build(str(tmp_path / 'store'), sources, workers=1)
+    assert store.symbols == list(symbols) and len(store) == 3 and 'B' in store
+    assert store.time is None
+    np.testing.assert_array_equal(store.offsets, [0, 300, 300, 420])
+    for name, bars in symbols.items():
+        for got, want in zip(store.ohlc(name), bars):
+            np.testing.assert_array_equal(got, want)
+    for field in FIELDS:
+        assert isinstance(store.bars[field], np.memmap) and not store.bars[field].flags.writeable
+
+
+def test_parallel_build(tmp_path):
+    sources = {str(k): write_csv(tmp_path / ('%d.csv' % k), ohlc(100 + k, k)) for k in range(4)}
+    serial = build(str(tmp_path / 'serial'), sources, workers=1)
+    parallel = build(str(tmp_path / 'parallel'), sources, workers=2)
+    for field in FIELDS:
+        np.testing.assert_array_equal(parallel.bars[field], serial.bars[field])
+
+
+def test_times(tmp_path, monkeypatch):
+    bars = ohlc(5, 0)
+    epoch = 1700000000 + 60 * np.arange(5)
+    iso = np.array(epoch, dtype='datetime64[s]')
+    columns = ('time', 'open', 'high', 'low', 'close')
+    numeric = write_csv(tmp_path / 'numeric.csv', bars, ','.join(columns), epoch)
+    text = write_csv(tmp_path / 'iso.csv', bars, 'Date,open,high,low,close', iso)
+    loadtxt, reads = np.loadtxt, []
+    monkeypatch.setattr(np, 'loadtxt',
+                        lambda file, *args, **kwargs: reads.append(file) or loadtxt(file, *args, **kwargs))
+    for file in (numeric, text):
+        columns = read(file)
+        assert columns['time'].dtype == np.int64
+        np.testing.assert_array_equal(columns['time'], epoch)
+        for field, values in zip(FIELDS, bars):
+            np.testing.assert_array_equal(columns[field], values)
+    # The CSV is parsed in a single pass, times included
+    assert reads == [numeric, text]
+    store = build(str(tmp_path / 'store'), {'numeric': numeric, 'iso': text}, workers=1)
+    np.testing.assert_array_equal(store.time, np.concatenate([epoch, epoch]))
+    # A source without times drops them for the whole store
+    plain = write_csv(tmp_path / 'plain.csv', bars)
+    assert build(str(tmp_path / 'store'), {'iso': text, 'plain': plain}, workers=1).time is None
+
+
+def test_missing_column(tmp_path):
+    with pytest.raises(ValueError, match='close'):
+        read(write_csv(tmp_path / 'bad.csv', ohlc(3, 0)[:3], 'open,high,low'))
+
+
+def test_npy_memmaps(tmp_path):
+    store = build(str(tmp_path / 'store'), {'A': write_csv(tmp_path / 'A.csv', ohlc(50, 0))}, workers=1)
+    for field in FIELDS:
+        mapped = np.load(os.path.join(store.path, field + '.npy'), mmap_mode='r')
+        assert mapped.dtype == np.float64
+        np.testing.assert_array_equal(mapped, store.bars[field])
+    np.testing.assert_array_equal(np.load(os.path.join(store.path, 'offsets.npy')), [0, 50])
+
+
+def test_source_cache(tmp_path):
+    path = str(tmp_path / 'store')
+    cached = os.path.join(path, 'source.hlc3.npy')
+    store = build(path, {'A': write_csv(tmp_path / 'A.csv', ohlc(200, 0))}, workers=1)
+    assert store.source('close') is store.bars['close']
+    with pytest.raises(ValueError):
+        store.source('hlc4')
+    assert not os.path.exists(cached)
+    np.testing.assert_array_equal(store.source('hlc3', 'A'), PRICE_SOURCES['hlc3'](*store.ohlc('A')))
+    assert os.path.exists(cached)
+    assert [name for name in os.listdir(path) if name.startswith('tmp')] == []
+
+    # Reopening reuses the cached file
+    stamp = os.stat(cached).st_mtime_ns
+    np.testing.assert_array_equal(BarStore(path).source('hlc3'), store.source('hlc3'))
+    assert os.stat(cached).st_mtime_ns == stamp
+
+    # Rebuilding the store drops the cache computed from the old bars
+    store = build(path, {'A': write_csv(tmp_path / 'A.csv', ohlc(150, 1))}, workers=1)
+    assert not os.path.exists(cached)
+    np.testing.assert_array_equal(store.source('hlc3', 'A'), PRICE_SOURCES['hlc3'](*store.ohlc('A')))